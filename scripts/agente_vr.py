@@ -1,3 +1,4 @@
+import logging
 import os
 
 from dotenv import load_dotenv
@@ -5,19 +6,46 @@ load_dotenv()
 
 from typing import List
 
-from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.runnables.base import Runnable
 
 from ferramentas import *
 
+logger = logging.getLogger(__name__)
+
 
 class AgenteVR:
 
-    def __init__(self):
+    def __init__(
+        self,
+        usar_cache_ferramentas: bool = os.environ.get("CACHE_FERRAMENTAS", "1") == "1",
+        usar_cache_llm: bool = os.environ.get("CACHE_LLM", "1") == "1",
+        acoes_concorrentes: bool = os.environ.get("ACOES_CONCORRENTES", "0") == "1",
+        compactar_contexto: bool = os.environ.get("COMPACTAR_CONTEXTO", "1") == "1",
+        verbose: bool = os.environ.get("AGENTE_VERBOSE", "1") == "1",
+    ):
         """
         Inicializar o Agente de VR/VA passando para ele o texto de prompt do que deve ser feito.
+        Com usar_cache_ferramentas, ações repetidas pelo agente reaproveitam o resultado da execução anterior.
+        Com usar_cache_llm, as respostas da LLM são guardadas em CACHE_LLM_PATH e reaproveitadas quando o mesmo
+        prompt é enviado ao mesmo modelo, com as mesmas ferramentas, em uma nova execução.
+        Com acoes_concorrentes, o prompt permite que o agente peça várias ações independentes de uma vez, que o
+        ainvoke executa ao mesmo tempo.
+        Com compactar_contexto, os arquivos nas observações das ferramentas são representados por handles curtos
+        e as ações anteriores reenviadas à LLM a cada turno são mantidas dentro do orçamento de tokens
+        (ORCAMENTO_TOKENS_SCRATCHPAD).
         """
-        tools = self._set_toolkit()
+        self.__acoes_concorrentes = acoes_concorrentes
+        self.__usar_cache_llm = usar_cache_llm
+        self.cache_llm = None
+        self.__compactar_contexto = compactar_contexto
+        from langchain.agents import AgentExecutor, create_react_agent
+
+        from contexto import CompactadorScratchpad, FerramentaCompacta, RegistroArtefatos
+
+        tools = self._set_toolkit(usar_cache_ferramentas)
+        self.artefatos = RegistroArtefatos()
+        if compactar_contexto:
+            tools = [FerramentaCompacta(tool, self.artefatos) for tool in tools]
         llm = self._load_llm()
         llm_with_tools = llm.bind_tools(tools)
         prompt = self._load_prompt()
@@ -32,10 +60,14 @@ class AgenteVR:
         )
 
         self.__agent_executor = AgentExecutor(
-            agent=agent, tools=tools, handle_parsing_errors=True, verbose=True
+            agent=agent,
+            tools=tools,
+            handle_parsing_errors=True,
+            verbose=verbose,
+            trim_intermediate_steps=CompactadorScratchpad() if compactar_contexto else -1,
         )
 
-    def _set_toolkit(self) -> List[str]:
+    def _set_toolkit(self, usar_cache_ferramentas: bool = False) -> List[str]:
         from langchain_community.agent_toolkits import FileManagementToolkit
 
         toolkit = FileManagementToolkit(selected_tools=["copy_file"])
@@ -44,8 +76,12 @@ class AgenteVR:
             ReunirDadosTool(),
             EscreverDadosNaPlanilhaTool(),
             EstadosDosSindicatosTool(),
+            ValoresDosEstadosTool(),
             RemoverColaboradoresNaPlanilhaTool()
         ]
+        if usar_cache_ferramentas:
+            cache = CacheResultadosFerramentas()
+            tools = [FerramentaComCache(tool, cache) for tool in tools]
         tools.extend(toolkit.get_tools())
         return tools
 
@@ -53,24 +89,33 @@ class AgenteVR:
         from langchain_google_genai import ChatGoogleGenerativeAI
         from langchain_ollama import ChatOllama
 
+        from cache_llm import CacheRespostasLLM
+
+        modelo = os.environ["LLM_MODEL"] if os.environ.get("GOOGLE_API_KEY") else os.environ["OLLAMA_LLM_MODEL"]
+        # Com cache=False, o modelo não usa nem o cache global do LangChain.
+        if self.__usar_cache_llm:
+            self.cache_llm = CacheRespostasLLM(modelo)
+        cache = self.cache_llm or False
+
         if os.environ.get("GOOGLE_API_KEY"):
-            llm = ChatGoogleGenerativeAI(model=os.environ["LLM_MODEL"], temperature=0)
+            llm = ChatGoogleGenerativeAI(model=modelo, temperature=0, cache=cache)
         else:
             llm = ChatOllama(
                 temperature=0,
-                model=os.environ["OLLAMA_LLM_MODEL"],
+                model=modelo,
                 base_url=os.environ["OLLAMA_URL"],
+                cache=cache,
             )
 
         return llm
 
     def _load_prompt(self):
-        from langchain import hub
+        # O template ReAct é mantido no repositório (prompts.py) em vez de obtido com hub.pull a cada execução.
+        from prompts import react_agent_prompt
 
-        prompt = hub.pull("langchain-ai/react-agent-template")
-        prompt = prompt.partial(instructions=self._load_instructions())
-
-        return prompt
+        return react_agent_prompt(
+            self._load_instructions(), self.__acoes_concorrentes, self.__compactar_contexto
+        )
 
     def _load_instructions(self) -> str:
 
@@ -83,4 +128,29 @@ class AgenteVR:
         return custom_prompt
 
     def invoke(self, instruction: str) -> None:
-        self.__agent_executor.invoke({"input": instruction})
+        from callbacks import CallbackInstrumentacao
+
+        self.__agent_executor.invoke(
+            {"input": instruction}, config={"callbacks": [CallbackInstrumentacao()]}
+        )
+        self.__salvar_artefatos()
+
+    async def ainvoke(self, instruction: str) -> None:
+        """
+        Versão assíncrona do invoke: as ferramentas são executadas fora do event loop e as ações independentes
+        pedidas em uma mesma resposta são executadas ao mesmo tempo.
+        """
+        from callbacks import CallbackInstrumentacao
+
+        await self.__agent_executor.ainvoke(
+            {"input": instruction}, config={"callbacks": [CallbackInstrumentacao()]}
+        )
+        self.__salvar_artefatos()
+
+    def __salvar_artefatos(self) -> None:
+        if self.cache_llm is not None:
+            logger.info("Cache da LLM: %s", self.cache_llm.estatisticas())
+
+        # O registro dos handles permite relacionar as ações do log do agente aos arquivos correspondentes.
+        if self.__compactar_contexto:
+            self.artefatos.salvar(os.path.join(os.environ.get("OUTPUT_FOLDER", "output"), "artefatos_agente.json"))
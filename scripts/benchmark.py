@@ -0,0 +1,395 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+import openpyxl
+
+import excel
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+CARGOS = [
+    "ANALISTA DADOS I",
+    "ANALISTA CONTABIL-FISCAL II",
+    "COORDENADOR ADMINISTRATIVO",
+    "TECH RECRUITER II",
+    "DIRETOR",
+    "ESTAGIARIO",
+    "APRENDIZ",
+]
+
+SITUACOES = ["Trabalhando", "Férias", "Auxílio Doença", "Licença Maternidade"]
+
+SINDICATOS = [
+    "SINDPD SP - SIND.TRAB.EM PROC DADOS E EMPR.EMPRESAS PROC DADOS ESTADO DE SP.",
+    "SINDPPD RS - SINDICATO DOS TRAB. EM PROC. DE DADOS RIO GRANDE DO SUL",
+    "SINDPD RJ - SINDICATO PROFISSIONAIS DE PROC DADOS DO RIO DE JANEIRO",
+    "SITEPD PR - SIND DOS TRAB EM EMPR PRIVADAS DE PROC DE DADOS DE CURITIBA E REGIAO METROPOLITANA",
+]
+
+# Dias úteis e valor diário de cada sindicato, como nas bases de dias úteis e de valores por estado.
+DIAS_UTEIS = [22, 21, 21, 22]
+VALORES_ESTADOS = {"São Paulo": 37.5, "Rio Grande do Sul": 35, "Rio de Janeiro": 35, "Paraná": 35}
+
+# Proporção de colaboradores em férias, desligados e admitidos no mês, próxima à das planilhas reais.
+PROPORCAO_FERIAS = 0.045
+PROPORCAO_DESLIGADOS = 0.03
+PROPORCAO_ADMISSOES = 0.045
+
+CABECALHO_PLANILHA_FINAL = [
+    "Matricula",
+    "Admissão",
+    "Sindicato do Colaborador",
+    "Competência",
+    "Dias",
+    "VALOR DIÁRIO VR",
+    "TOTAL",
+    "Custo empresa",
+    "Desconto profissional",
+    "OBS GERAL",
+]
+
+ETAPAS = ["mesclar", "remover", "preencher", "escrever"]
+
+# Módulos cujo tempo de importação em um processo novo é medido como o tempo de inicialização.
+MODULOS_INICIALIZACAO = ["main", "pipeline", "agente_vr"]
+
+CARGOS_REMOVIDOS = ["diretores", "estagiários", "aprendiz"]
+
+
+def gerar_planilha_ativos(path: str, num_colaboradores: int, seed: int = 42) -> str:
+    """
+    Gera uma base de ativos sintética com o mesmo layout da planilha ATIVOS.xlsx.
+    """
+    rnd = random.Random(seed)
+
+    return __gravar_planilha(
+        path,
+        ["MATRICULA", "EMPRESA", "TITULO DO CARGO", "DESC. SITUACAO", "Sindicato"],
+        (
+            [matricula, 1410, rnd.choice(CARGOS), rnd.choice(SITUACOES), rnd.choice(SINDICATOS)]
+            for matricula in range(10000, 10000 + num_colaboradores)
+        ),
+    )
+
+
+def gerar_bases(diretorio: str, num_colaboradores: int, seed: int = 42) -> dict[str, str]:
+    """
+    Gera no diretório as planilhas de uma competência sintética com num_colaboradores ativos, com os mesmos
+    layouts e os mesmos erros de digitação dos cabeçalhos das planilhas reais ("MATRICULA " com espaço no fim,
+    "SINDICADO", "DIAS UTEIS ", o "ESTADO" seguido de espaços não separáveis, o título acima do cabeçalho e a
+    linha de caracteres invisíveis no fim da base de valores). Retorna o caminho de cada planilha.
+    """
+    rnd = random.Random(seed)
+    matriculas = range(10000, 10000 + num_colaboradores)
+    inicio_competencia = datetime(2025, 4, 15)
+
+    bases = {"ativos": gerar_planilha_ativos(os.path.join(diretorio, "ATIVOS.xlsx"), num_colaboradores, seed)}
+
+    bases["ferias"] = __gravar_planilha(
+        os.path.join(diretorio, "FERIAS.xlsx"),
+        ["MATRICULA", "DESC. SITUACAO", "DIAS DE FÉRIAS"],
+        (
+            [matricula, "Férias", rnd.choice([5, 10, 15, 20, 30])]
+            for matricula in __amostra(rnd, matriculas, PROPORCAO_FERIAS)
+        ),
+    )
+
+    bases["desligados"] = __gravar_planilha(
+        os.path.join(diretorio, "DESLIGADOS.xlsx"),
+        ["MATRICULA ", "DATA DEMISSÃO", "COMUNICADO DE DESLIGAMENTO"],
+        (
+            [matricula, inicio_competencia + timedelta(days=rnd.randrange(30)), rnd.choice(["OK", None])]
+            for matricula in __amostra(rnd, matriculas, PROPORCAO_DESLIGADOS)
+        ),
+    )
+
+    num_admissoes = max(1, int(num_colaboradores * PROPORCAO_ADMISSOES))
+    bases["admissao"] = __gravar_planilha(
+        os.path.join(diretorio, "ADMISSAO ABRIL.xlsx"),
+        ["MATRICULA", "Admissão", "Cargo", None],
+        (
+            [matricula, datetime(2025, 4, 1) + timedelta(days=rnd.randrange(30)), rnd.choice(CARGOS), None]
+            for matricula in range(10000 + num_colaboradores, 10000 + num_colaboradores + num_admissoes)
+        ),
+    )
+
+    bases["dias_uteis"] = __gravar_planilha(
+        os.path.join(diretorio, "Base dias uteis.xlsx"),
+        ["BASE DIAS UTEIS DE 15/04 a 15/05", None],
+        [["SINDICADO", "DIAS UTEIS "]] + [list(par) for par in zip(SINDICATOS, DIAS_UTEIS)] + [[None, None]],
+    )
+
+    bases["valores"] = __gravar_planilha(
+        os.path.join(diretorio, "Base sindicato x valor.xlsx"),
+        ["ESTADO" + "\xa0" * 53, "VALOR"],
+        [list(par) for par in VALORES_ESTADOS.items()] + [["​" * 6, None]],
+    )
+
+    bases["planilha_final"] = gerar_planilha_final(os.path.join(diretorio, "VR MENSAL 05.2025.xlsx"))
+
+    return bases
+
+
+def gerar_planilha_final(path: str) -> str:
+    """
+    Gera uma planilha final vazia com o layout da VR MENSAL: o total na primeira linha e o cabeçalho na segunda.
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "VR MENSAL 05.2025"
+    ws["G1"] = "=SUM(G3:G3)"
+    ws.append(CABECALHO_PLANILHA_FINAL)
+    wb.save(path)
+
+    return path
+
+
+def medir(funcao: Callable, *args, **kwargs) -> tuple[Any, dict]:
+    """
+    Executa a função uma vez, retornando o resultado, o tempo total, o tempo de CPU do processo, a variação da
+    memória residente durante a função e o pico de memória do processo desde o seu início.
+    """
+    inicio_wall = time.perf_counter()
+    inicio_cpu = time.process_time()
+    inicio_rss = instrumentacao.rss_atual_mb()
+    resultado = funcao(*args, **kwargs)
+    rss = instrumentacao.rss_atual_mb()
+    return resultado, {
+        "wall_s": time.perf_counter() - inicio_wall,
+        "cpu_processo_s": time.process_time() - inicio_cpu,
+        "rss_delta_mb": rss - inicio_rss if rss is not None and inicio_rss is not None else None,
+        "rss_pico_processo_mb": instrumentacao.rss_pico_processo_mb(),
+    }
+
+
+def executar_benchmark(
+    num_colaboradores: int, diretorio: str, seed: int = 42, etapas: Optional[list[str]] = None
+) -> list[dict]:
+    """
+    Gera as bases sintéticas e mede as rotinas de planilha na ordem do pipeline: a mesclagem das bases, a remoção
+    dos cargos, o preenchimento da planilha final com preencher_planilha e a geração da planilha final pela
+    ferramenta EscreverDadosNaPlanilha. As etapas intermediárias não medidas (estados e valores dos sindicatos)
+    são executadas pelas próprias ferramentas, sem LLM.
+    """
+    from ferramentas import EscreverDadosNaPlanilhaTool, EstadosDosSindicatosTool, ValoresDosEstadosTool
+
+    etapas = etapas or ETAPAS
+    excel.invalidar_cache()
+    bases = gerar_bases(diretorio, num_colaboradores, seed)
+    medicoes = []
+
+    def registrar(etapa: str, funcao: Callable, *args, **kwargs) -> Any:
+        resultado, medicao = medir(funcao, *args, **kwargs)
+        if etapa in etapas:
+            medicoes.append({"colaboradores": num_colaboradores, "etapa": etapa, **medicao})
+        return resultado
+
+    colaboradores = registrar(
+        "mesclar",
+        excel.mesclar,
+        [bases[nome] for nome in ("ativos", "ferias", "desligados", "admissao", "dias_uteis")],
+        os.path.join(diretorio, "merged.parquet"),
+    )
+    registrar(
+        "remover",
+        excel.remover_registros_planilha_por_valores_especificos_coluna,
+        colaboradores,
+        "Cargo",
+        CARGOS_REMOVIDOS,
+    )
+
+    colaboradores = EstadosDosSindicatosTool()._run(colaboradores)
+    colaboradores = ValoresDosEstadosTool()._run(colaboradores, bases["valores"])
+
+    if "preencher" in etapas:
+        planilha_final = shutil.copy(bases["planilha_final"], os.path.join(diretorio, "preenchida.xlsx"))
+        registrar(
+            "preencher",
+            excel.preencher_planilha,
+            colaboradores,
+            planilha_final,
+            indice_planilha_destino=2,
+            max_col_planilha_destino=6,
+        )
+
+    if "escrever" in etapas:
+        planilha_final = shutil.copy(bases["planilha_final"], os.path.join(diretorio, "final.xlsx"))
+        registrar(
+            "escrever",
+            EscreverDadosNaPlanilhaTool()._run,
+            colaboradores,
+            planilha_final,
+            "05.2025",
+            80,
+            20,
+        )
+
+    return medicoes
+
+
+def medir_inicializacao(modulos: Optional[list[str]] = None, repeticoes: int = 5) -> list[dict]:
+    """
+    Mede o tempo de inicialização de cada módulo como a mediana do tempo de um processo Python novo que apenas
+    o importa, com os imports sob demanda das ferramentas incluídos no que não é medido.
+    """
+    medicoes = []
+    for modulo in modulos or MODULOS_INICIALIZACAO:
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-c", f"import {modulo}"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                check=True,
+                capture_output=True,
+            )
+            tempos.append(time.perf_counter() - inicio)
+        medicoes.append(
+            {
+                "colaboradores": 0,
+                "etapa": f"inicializacao:{modulo}",
+                "wall_s": statistics.median(tempos),
+                "cpu_processo_s": None,
+                "rss_delta_mb": None,
+                "rss_pico_processo_mb": None,
+            }
+        )
+
+    return medicoes
+
+
+def registrar_resultados(medicoes: list[dict], path: str) -> list[dict]:
+    """
+    Acrescenta as medições ao histórico em JSON Lines, com a data, o commit e a versão do Python, e retorna as
+    medições com a variação em relação à última medição registrada do mesmo tamanho e da mesma etapa.
+    """
+    anteriores = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    registro = json.loads(linha)
+                    anteriores[(registro["colaboradores"], registro["etapa"])] = registro
+
+    contexto = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": __commit_atual(),
+        "python": platform.python_version(),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for medicao in medicoes:
+            f.write(json.dumps({**contexto, **medicao}, ensure_ascii=False) + "\n")
+
+    resultados = []
+    for medicao in medicoes:
+        anterior = anteriores.get((medicao["colaboradores"], medicao["etapa"]))
+        resultados.append(
+            {
+                **medicao,
+                "anterior_s": anterior["wall_s"] if anterior else None,
+                "variacao": medicao["wall_s"] / anterior["wall_s"] - 1 if anterior and anterior["wall_s"] else None,
+            }
+        )
+
+    return resultados
+
+
+def __gravar_planilha(path: str, cabecalho: list, linhas) -> str:
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(cabecalho)
+    for linha in linhas:
+        ws.append(linha)
+    wb.save(path)
+
+    return path
+
+
+def __amostra(rnd: random.Random, matriculas: range, proporcao: float) -> list[int]:
+    return rnd.sample(matriculas, max(1, int(len(matriculas) * proporcao)))
+
+
+def __commit_atual() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede o tempo das rotinas de planilha em bases sintéticas de tamanhos crescentes, sem LLM."
+    )
+    parser.add_argument(
+        "tamanhos",
+        nargs="*",
+        type=int,
+        default=[1000, 10000, 100000],
+        help="Quantidades de colaboradores das bases geradas.",
+    )
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS, help="Etapas medidas.")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do gerador das bases.")
+    parser.add_argument(
+        "--resultados",
+        default=os.path.join(os.environ.get("OUTPUT_FOLDER", "output"), "benchmark.jsonl"),
+        help="Histórico das medições em JSON Lines, usado para comparar cada execução com a anterior.",
+    )
+    parser.add_argument(
+        "--inicializacao",
+        action="store_true",
+        help="Mede também o tempo de importação de main, pipeline e agente_vr em processos novos.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    medicoes = medir_inicializacao() if args.inicializacao else []
+    for tamanho in args.tamanhos:
+        diretorio = tempfile.mkdtemp()
+        try:
+            medicoes += executar_benchmark(tamanho, diretorio, args.seed, args.etapas)
+        finally:
+            shutil.rmtree(diretorio)
+
+    print(
+        f"{'colaboradores':>14} {'etapa':>24} {'tempo (s)':>10} {'CPU (s)':>10} {'us/linha':>10} "
+        f"{'ΔRSS (MB)':>10} {'pico (MB)':>10} {'anterior':>10} {'variação':>9}"
+    )
+    for resultado in registrar_resultados(medicoes, args.resultados):
+        cpu = f"{resultado['cpu_processo_s']:.3f}" if resultado["cpu_processo_s"] is not None else "-"
+        por_linha = (
+            f"{resultado['wall_s'] / resultado['colaboradores'] * 1e6:.1f}" if resultado["colaboradores"] else "-"
+        )
+        rss = f"{resultado['rss_delta_mb']:+.1f}" if resultado["rss_delta_mb"] is not None else "-"
+        pico = f"{resultado['rss_pico_processo_mb']:.1f}" if resultado["rss_pico_processo_mb"] is not None else "-"
+        anterior = f"{resultado['anterior_s']:.3f}" if resultado["anterior_s"] is not None else "-"
+        variacao = f"{resultado['variacao']:+.1%}" if resultado["variacao"] is not None else "-"
+        print(
+            f"{resultado['colaboradores']:>14} {resultado['etapa']:>24} {resultado['wall_s']:>10.3f} "
+            f"{cpu:>10} {por_linha:>10} {rss:>10} {pico:>10} {anterior:>10} {variacao:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
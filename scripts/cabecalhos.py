@@ -0,0 +1,206 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import rapidfuzz
+
+import similaridade
+
+logger = logging.getLogger(__name__)
+
+# Score mínimo de um par (nome procurado, célula de cabeçalho) para que ele seja gravado no arquivo de aliases;
+# é o menor limiar usado na busca pelos cabeçalhos (casar_celulas_cabecalho).
+SCORE_MINIMO_ALIAS = 80
+
+
+class ResolvedorCabecalhos:
+    """
+    Resolução dos nomes de colunas nos cabeçalhos das planilhas com memorização. O score de cada par (nome
+    procurado, célula de cabeçalho), já normalizados, é calculado uma única vez por scorer e guardado em um
+    dict em memória, de modo que os cabeçalhos conhecidos são resolvidos sem nenhum cálculo de similaridade.
+    Com um arquivo de aliases, apenas os pares com score de pelo menos SCORE_MINIMO_ALIAS são gravados ao
+    final da execução e carregados na seguinte; um par ausente do arquivo é pontuado novamente. Aliases
+    confirmados podem ser incluídos no arquivo com score 100, por exemplo
+    {"partial_ratio": {"matricula": {"matrícula": 100}}}.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.__scores: dict[str, dict[str, dict[str, int]]] = {}
+        self.__alterado = False
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.__scores = self.__ler(path)
+
+    def pontuar(self, consulta: str, candidatos: Sequence[Optional[str]], scorer: str = "ratio") -> np.ndarray:
+        """
+        Equivalente a similaridade.pontuar: scores da consulta contra todos os candidatos, com 0 para os None.
+        Apenas os candidatos ainda desconhecidos são pontuados, em um único lote.
+        """
+        consulta = similaridade.normalizar(consulta)
+        normalizados = [similaridade.normalizar(c) if c is not None else None for c in candidatos]
+
+        with self.__lock:
+            conhecidos = self.__scores.setdefault(scorer, {}).setdefault(consulta, {})
+            novos = list(dict.fromkeys(c for c in normalizados if c is not None and c not in conhecidos))
+            self.hits += sum(1 for c in normalizados if c is not None) - len(novos)
+            self.misses += len(novos)
+
+        if novos:
+            scores = similaridade.matriz_similaridade([consulta], novos, scorer)[0]
+            with self.__lock:
+                conhecidos.update(zip(novos, (int(score) for score in scores)))
+                self.__alterado = True
+
+        return np.array([conhecidos[c] if c is not None else 0 for c in normalizados], dtype=np.int16)
+
+    def indices_acima(
+        self, consulta: str, candidatos: Sequence[Optional[str]], limiar: int, scorer: str = "ratio"
+    ) -> Tuple[int, ...]:
+        scores = self.pontuar(consulta, candidatos, scorer)
+        return tuple(int(j) for j in np.flatnonzero(scores > limiar))
+
+    def primeiro_par_acima(
+        self,
+        consultas: Sequence[Optional[str]],
+        candidatos: Sequence[Optional[str]],
+        limiar: int,
+        scorer: str = "ratio",
+    ) -> Optional[Tuple[int, int]]:
+        """
+        O primeiro par (i, j), na ordem consulta a consulta, cujo score é maior que o limiar.
+        """
+        for i, consulta in enumerate(consultas):
+            if consulta is None:
+                continue
+            indices = self.indices_acima(consulta, candidatos, limiar, scorer)
+            if indices:
+                return i, indices[0]
+        return None
+
+    def estatisticas(self) -> dict:
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "pares": sum(len(c) for s in self.__scores.values() for c in s.values()),
+            }
+
+    def usar_arquivo(self, path: Optional[str]) -> None:
+        """
+        Passa a usar outro arquivo de aliases, como o da pasta de saída de cada trabalho do lote, gravando antes
+        no arquivo atual os scores pendentes. Os scores já calculados continuam em memória, acrescidos dos
+        aliases do novo arquivo, e são gravados nele, inclusive os usados pelo trabalho sem novos cálculos.
+        """
+        if path == self.path:
+            return
+
+        self.salvar()
+        scores = self.__ler(path) if path else {}
+        with self.__lock:
+            self.path = path
+            for scorer, consultas in scores.items():
+                for consulta, conhecidos in consultas.items():
+                    self.__scores.setdefault(scorer, {}).setdefault(consulta, {}).update(conhecidos)
+            self.__alterado = True
+
+    def salvar(self) -> None:
+        """
+        Grava os scores no arquivo de aliases, reunidos aos que outros processos tenham gravado nesse meio tempo.
+        A gravação é feita em um arquivo temporário substituído ao final, para nunca deixar o arquivo incompleto.
+        """
+        if not self.path or not self.__alterado:
+            return
+
+        with self.__lock:
+            scores = self.__ler(self.path)
+            for scorer, consultas in self.__scores.items():
+                for consulta, conhecidos in consultas.items():
+                    aliases = {c: score for c, score in conhecidos.items() if score >= SCORE_MINIMO_ALIAS}
+                    if aliases:
+                        scores.setdefault(scorer, {}).setdefault(consulta, {}).update(aliases)
+            self.__alterado = False
+
+        try:
+            diretorio = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(diretorio, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=diretorio, suffix=".tmp", delete=False
+            ) as f:
+                json.dump(
+                    {"rapidfuzz": rapidfuzz.__version__, "scores": scores}, f, ensure_ascii=False, indent=1
+                )
+            os.replace(f.name, self.path)
+        except OSError as e:
+            logger.warning("Não foi possível gravar os aliases de cabeçalhos em %s: %s", self.path, e)
+
+    @staticmethod
+    def __ler(path: str) -> dict:
+        try:
+            with open(path, encoding="utf-8") as f:
+                conteudo = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignorando o arquivo de aliases de cabeçalhos %s: %s", path, e)
+            return {}
+
+        # Scores calculados por outra versão do rapidfuzz podem ser diferentes e são descartados, assim como os
+        # abaixo do mínimo gravados por versões anteriores deste módulo.
+        if conteudo.get("rapidfuzz") != rapidfuzz.__version__:
+            return {}
+        return {
+            scorer: {
+                consulta: {c: score for c, score in conhecidos.items() if score >= SCORE_MINIMO_ALIAS}
+                for consulta, conhecidos in consultas.items()
+            }
+            for scorer, consultas in conteudo.get("scores", {}).items()
+        }
+
+
+__resolvedor: Optional[ResolvedorCabecalhos] = None
+__lock_resolvedor = threading.Lock()
+
+
+def arquivo_aliases() -> Optional[str]:
+    """
+    Arquivo de aliases: o informado em ALIASES_CABECALHOS (vazio para não gravar os aliases) ou, por padrão,
+    aliases_cabecalhos.json na pasta OUTPUT_FOLDER. Sem nenhuma das duas variáveis, os aliases não são gravados,
+    para que a execução não crie arquivos no diretório corrente.
+    """
+    if "ALIASES_CABECALHOS" in os.environ:
+        return os.environ["ALIASES_CABECALHOS"] or None
+    if os.environ.get("OUTPUT_FOLDER"):
+        return os.path.join(os.path.abspath(os.environ["OUTPUT_FOLDER"]), "aliases_cabecalhos.json")
+    return None
+
+
+def obter_resolvedor() -> ResolvedorCabecalhos:
+    """
+    Resolvedor compartilhado pelo processo, com os aliases gravados ao final no arquivo_aliases() lido na sua
+    criação. Quem altera a pasta de saída durante o processo (o lote) informa o novo arquivo com usar_arquivo.
+    """
+    global __resolvedor
+
+    with __lock_resolvedor:
+        if __resolvedor is None:
+            __resolvedor = ResolvedorCabecalhos(arquivo_aliases())
+            atexit.register(__resolvedor.salvar)
+        return __resolvedor
+
+
+def pontuar(consulta: str, candidatos: Sequence[Optional[str]], scorer: str = "ratio") -> np.ndarray:
+    return obter_resolvedor().pontuar(consulta, candidatos, scorer)
+
+
+def primeiro_par_acima(
+    consultas: Sequence[Optional[str]], candidatos: Sequence[Optional[str]], limiar: int, scorer: str = "ratio"
+) -> Optional[Tuple[int, int]]:
+    return obter_resolvedor().primeiro_par_acima(consultas, candidatos, limiar, scorer)
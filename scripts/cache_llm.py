@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+logger = logging.getLogger(__name__)
+
+# Arquivo SQLite com as respostas da LLM guardadas entre as execuções.
+ARQUIVO_CACHE_LLM = os.environ.get(
+    "CACHE_LLM_PATH", os.path.join(os.environ.get("OUTPUT_FOLDER", "output"), "cache_llm.sqlite")
+)
+
+# Tamanho máximo das respostas guardadas, em MB; acima dele, as menos usadas recentemente são descartadas.
+MAX_MB_CACHE_LLM = float(os.environ.get("CACHE_LLM_MAX_MB", 50))
+
+
+class CacheRespostasLLM(BaseCache):
+    """
+    Cache persistente das respostas da LLM em SQLite, usado como cache do modelo de chat (parâmetro cache dos
+    modelos do LangChain). Com temperature=0, um mesmo prompt produz a mesma resposta, de modo que uma nova
+    execução com as mesmas instruções e entradas (por exemplo, após uma correção nas ferramentas) repete os
+    passos do agente sem chamar o modelo. A chave é o hash do nome do modelo com a configuração informada pelo
+    LangChain (parâmetros e schema das ferramentas vinculadas) e o hash do prompt; o nome do modelo é informado
+    à parte porque nem todos os modelos o incluem na configuração. Acima de max_mb, as respostas usadas há mais
+    tempo são descartadas.
+    """
+
+    def __init__(self, modelo: str, path: str = ARQUIVO_CACHE_LLM, max_mb: float = MAX_MB_CACHE_LLM):
+        self.modelo = modelo
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__conexao: Optional[sqlite3.Connection] = None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        chave = self.__chave(prompt, llm_string)
+        with self.__lock:
+            conexao = self.__conectar()
+            linha = conexao.execute(
+                "SELECT resposta FROM respostas WHERE hash_modelo = ? AND hash_prompt = ?", chave
+            ).fetchone()
+            if linha is None:
+                self.misses += 1
+                return None
+            conexao.execute(
+                "UPDATE respostas SET ultimo_acesso = ?, acessos = acessos + 1 "
+                "WHERE hash_modelo = ? AND hash_prompt = ?",
+                (time.time(), *chave),
+            )
+            conexao.commit()
+            self.hits += 1
+
+        try:
+            geracoes = [
+                ChatGeneration(
+                    message=AIMessage.model_validate(geracao["message"]),
+                    generation_info=geracao.get("generation_info"),
+                )
+                for geracao in json.loads(linha[0])
+            ]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignorando a resposta guardada no cache da LLM que não pôde ser lida: %s", e)
+            return None
+
+        logger.info("Cache da LLM: hit de %s (prompt %s).", self.modelo, chave[1][:12])
+        return [self.__sem_consumo(geracao) for geracao in geracoes]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        chave = self.__chave(prompt, llm_string)
+        resposta = json.dumps(
+            [
+                {"message": geracao.message.model_dump(mode="json"), "generation_info": geracao.generation_info}
+                for geracao in return_val
+                if isinstance(geracao, ChatGeneration)
+            ],
+            ensure_ascii=False,
+            default=str,
+        )
+        with self.__lock:
+            conexao = self.__conectar()
+            conexao.execute(
+                "INSERT OR REPLACE INTO respostas "
+                "(hash_modelo, hash_prompt, modelo, resposta, tamanho, criado_em, ultimo_acesso, acessos) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (*chave, self.modelo, resposta, len(resposta), time.time(), time.time()),
+            )
+            self.__descartar_excedente(conexao)
+            conexao.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.__lock:
+            conexao = self.__conectar()
+            conexao.execute("DELETE FROM respostas")
+            conexao.commit()
+
+    def estatisticas(self) -> dict:
+        with self.__lock:
+            respostas, tamanho = self.__conectar().execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "respostas": respostas, "mb": round(tamanho / 2**20, 2)}
+
+    def __conectar(self) -> sqlite3.Connection:
+        # Uma única conexão, usada sob o lock, atende as threads do agente assíncrono.
+        if self.__conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.__conexao = sqlite3.connect(self.path, check_same_thread=False)
+            self.__conexao.execute(
+                """
+                CREATE TABLE IF NOT EXISTS respostas (
+                    hash_modelo TEXT NOT NULL,
+                    hash_prompt TEXT NOT NULL,
+                    modelo TEXT,
+                    resposta TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    criado_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL,
+                    acessos INTEGER NOT NULL,
+                    PRIMARY KEY (hash_modelo, hash_prompt)
+                )
+                """
+            )
+            self.__conexao.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acesso ON respostas (ultimo_acesso)")
+        return self.__conexao
+
+    def __descartar_excedente(self, conexao: sqlite3.Connection) -> None:
+        (tamanho,) = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()
+        if tamanho <= self.max_bytes:
+            return
+
+        descartadas = 0
+        for hash_modelo, hash_prompt, tamanho_resposta in conexao.execute(
+            "SELECT hash_modelo, hash_prompt, tamanho FROM respostas ORDER BY ultimo_acesso"
+        ).fetchall():
+            if tamanho <= self.max_bytes:
+                break
+            conexao.execute(
+                "DELETE FROM respostas WHERE hash_modelo = ? AND hash_prompt = ?", (hash_modelo, hash_prompt)
+            )
+            tamanho -= tamanho_resposta
+            descartadas += 1
+        logger.info(
+            "Cache da LLM: %d respostas descartadas para manter o limite de %d bytes.", descartadas, self.max_bytes
+        )
+
+    def __chave(self, prompt: str, llm_string: str) -> tuple[str, str]:
+        return (
+            hashlib.sha256(f"{self.modelo}\n{llm_string}".encode("utf-8")).hexdigest(),
+            hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        )
+
+    @staticmethod
+    def __sem_consumo(geracao: ChatGeneration) -> ChatGeneration:
+        # Uma resposta do cache não consome tokens; o relatório da execução registra apenas o consumo real.
+        if geracao.message.usage_metadata:
+            geracao.message = geracao.message.model_copy(
+                update={"usage_metadata": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}}
+            )
+        return geracao
+
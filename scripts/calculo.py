@@ -0,0 +1,98 @@
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from referencias import coluna_dataframe
+
+logger = logging.getLogger(__name__)
+
+COLUNA_TOTAL = "TOTAL"
+COLUNA_CUSTO_EMPRESA = "Custo empresa"
+COLUNA_DESCONTO_PROFISSIONAL = "Desconto profissional"
+
+# Quantidade de casas decimais dos valores calculados (centavos).
+CASAS_DECIMAIS = 2
+
+
+def calcular_vr(
+    df: pd.DataFrame,
+    percentual_custo_empresa: float,
+    percentual_custo_empregado: float,
+    coluna_dias: str = "Dias",
+    coluna_valor: str = "Valor",
+) -> pd.DataFrame:
+    """
+    Calcula, para todos os colaboradores de uma vez, o total do VR (dias × valor diário), o custo da empresa e o
+    desconto do profissional, arredondados em centavos com ROUND_HALF_UP. Os percentuais podem ser informados
+    como fração (0.8) ou como porcentagem (80). Quando somam 100%, o desconto é o total menos o custo da empresa,
+    de modo que as duas parcelas sempre fecham o total. Linhas sem dias ou sem valor ficam sem resultado (NaN).
+    """
+    percentual_custo_empresa = normalizar_percentual(percentual_custo_empresa)
+    percentual_custo_empregado = normalizar_percentual(percentual_custo_empregado)
+
+    dias = pd.to_numeric(coluna_dataframe(df, coluna_dias), errors="coerce")
+    valor = pd.to_numeric(coluna_dataframe(df, coluna_valor), errors="coerce")
+
+    total = multiplicar(dias, valor)
+    custo_empresa = multiplicar(total, percentual_custo_empresa)
+    if percentual_custo_empresa + percentual_custo_empregado == 1:
+        desconto_profissional = (np.rint(total * 100) - np.rint(custo_empresa * 100)) / 100
+    else:
+        desconto_profissional = multiplicar(total, percentual_custo_empregado)
+
+    return pd.DataFrame(
+        {
+            COLUNA_TOTAL: total,
+            COLUNA_CUSTO_EMPRESA: custo_empresa,
+            COLUNA_DESCONTO_PROFISSIONAL: desconto_profissional,
+        },
+        index=df.index,
+    )
+
+
+def multiplicar(a: pd.Series, b: Union[pd.Series, float, Decimal]) -> np.ndarray:
+    """
+    Produto arredondado em centavos calculado em Decimal. Como os pares distintos (dias, valor) são poucos, cada
+    par é calculado uma única vez e o resultado é distribuído para todas as linhas pelos códigos do factorize.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.broadcast_to(np.asarray(b if not isinstance(b, Decimal) else float(b), dtype=float), a.shape)
+    resultado = np.full(a.shape, np.nan)
+
+    validos = ~(np.isnan(a) | np.isnan(b))
+    if not validos.any():
+        return resultado
+
+    codigos, pares = pd.MultiIndex.from_arrays([a[validos], b[validos]]).factorize()
+    produtos = np.array([float(__arredondar(__decimal(x) * __decimal(y))) for x, y in pares])
+    resultado[validos] = produtos[codigos]
+
+    return resultado
+
+
+def normalizar_percentual(percentual: Union[float, Decimal]) -> Decimal:
+    percentual = __decimal(percentual)
+    return percentual / 100 if percentual > 1 else percentual
+
+
+def totalizar(df_calculado: pd.DataFrame) -> dict[str, Decimal]:
+    """
+    Somas exatas de cada coluna calculada, feitas em centavos inteiros, para conferência dos totais.
+    """
+    escala = 10**CASAS_DECIMAIS
+    return {
+        coluna: Decimal(int(np.rint(df_calculado[coluna].dropna().to_numpy() * escala).sum())) / escala
+        for coluna in df_calculado.columns
+    }
+
+
+def __decimal(valor: Union[float, Decimal]) -> Decimal:
+    # A representação decimal mais curta do float (repr) evita herdar o erro binário, como em 0.1 ou 37.5.
+    return valor if isinstance(valor, Decimal) else Decimal(repr(float(valor)))
+
+
+def __arredondar(valor: Decimal) -> Decimal:
+    return valor.quantize(Decimal(1).scaleb(-CASAS_DECIMAIS), rounding=ROUND_HALF_UP)
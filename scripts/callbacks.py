@@ -0,0 +1,89 @@
+import logging
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackInstrumentacao(BaseCallbackHandler):
+    """
+    Callback do LangChain que registra as chamadas de LLM e de ferramentas na execução instrumentada em
+    andamento (ver instrumentacao.instrumentar), incluindo o consumo de tokens de cada chamada de LLM.
+    """
+
+    def __init__(self):
+        self.__etapas = {}
+
+    def on_llm_start(self, serialized: dict, prompts: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__iniciar("llm", self.__nome(serialized, kwargs, "llm"), run_id)
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__iniciar("llm", self.__nome(serialized, kwargs, "llm"), run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        etapa = self.__finalizar(run_id)
+        if etapa is not None:
+            etapa.tokens_entrada, etapa.tokens_saida = self.__tokens(response)
+            logger.info(
+                "Chamada de LLM %s: %s tokens de entrada e %s de saída em %.2f s.",
+                etapa.nome,
+                etapa.tokens_entrada,
+                etapa.tokens_saida,
+                etapa.wall_s,
+            )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__finalizar(run_id, error)
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__iniciar("ferramenta", self.__nome(serialized, kwargs, "ferramenta"), run_id)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__finalizar(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__finalizar(run_id, error)
+
+    def __iniciar(self, tipo: str, nome: str, run_id: UUID) -> None:
+        registro = instrumentacao.registro_atual()
+        if registro is not None:
+            self.__etapas[run_id] = registro.iniciar(tipo, nome)
+
+    def __finalizar(self, run_id: UUID, erro: Optional[BaseException] = None) -> Optional[instrumentacao.Etapa]:
+        etapa = self.__etapas.pop(run_id, None)
+        registro = instrumentacao.registro_atual()
+        if etapa is not None and registro is not None:
+            registro.finalizar(etapa, erro)
+        return etapa
+
+    @staticmethod
+    def __nome(serialized: Optional[dict], kwargs: dict, padrao: str) -> str:
+        if kwargs.get("name"):
+            return kwargs["name"]
+        serialized = serialized or {}
+        if serialized.get("name"):
+            return serialized["name"]
+        return (serialized.get("id") or [padrao])[-1]
+
+    @staticmethod
+    def __tokens(response: LLMResult) -> tuple:
+        # Os provedores informam o consumo no llm_output (token_usage ou usage_metadata) ou em cada mensagem gerada.
+        uso = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata")
+        if uso:
+            entrada = uso.get("prompt_tokens", uso.get("input_tokens"))
+            saida = uso.get("completion_tokens", uso.get("output_tokens"))
+            return entrada, saida
+
+        entrada = saida = None
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                metadados = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+                if metadados:
+                    entrada = (entrada or 0) + metadados.get("input_tokens", 0)
+                    saida = (saida or 0) + metadados.get("output_tokens", 0)
+        return entrada, saida
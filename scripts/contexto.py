@@ -0,0 +1,225 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, List, Optional
+
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks.manager import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools.base import BaseTool
+
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+# Orçamento, em tokens estimados, das ações e observações anteriores reenviadas à LLM a cada turno do agente.
+ORCAMENTO_TOKENS_SCRATCHPAD = int(os.environ.get("ORCAMENTO_TOKENS_SCRATCHPAD", 2000))
+
+# Tamanho máximo de uma observação de ferramenta no scratchpad, em caracteres.
+MAX_CARACTERES_OBSERVACAO = int(os.environ.get("MAX_CARACTERES_OBSERVACAO", 1500))
+
+# Tamanho ao qual as observações mais antigas são reduzidas quando o scratchpad excede o orçamento.
+CARACTERES_RESUMO_OBSERVACAO = 300
+
+# Estimativa de caracteres por token; os modelos usados (Gemini e Ollama) não expõem o tokenizador localmente.
+CARACTERES_POR_TOKEN = 4
+
+PREFIXO_ARTEFATO = "arq"
+
+_PADRAO_ARTEFATO = re.compile(rf"^\[?({PREFIXO_ARTEFATO}\d+)\]?$")
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+class RegistroArtefatos:
+    """
+    Registro local dos arquivos produzidos pelas ferramentas do agente, identificados por handles curtos (arq1,
+    arq2, ...). As observações enviadas à LLM trazem o handle e o nome do arquivo em vez do caminho completo, e os
+    handles usados pela LLM nos argumentos das ferramentas são trocados de volta pelos caminhos.
+    """
+
+    def __init__(self):
+        self.__handles: dict[str, str] = {}
+        self.__paths: dict[str, str] = {}
+        self.__lock = threading.Lock()
+
+    def registrar(self, path: str) -> str:
+        path = os.path.abspath(path)
+        with self.__lock:
+            if path not in self.__handles:
+                handle = f"{PREFIXO_ARTEFATO}{len(self.__handles) + 1}"
+                self.__handles[path] = handle
+                self.__paths[handle] = path
+            return self.__handles[path]
+
+    def path(self, handle: str) -> Optional[str]:
+        with self.__lock:
+            return self.__paths.get(handle)
+
+    def resolver(self, valor: Any) -> Any:
+        """
+        Troca os handles contidos no valor (string, inclusive separada por vírgulas, lista ou dict) pelos caminhos
+        dos arquivos. Strings que não são handles registrados são mantidas.
+        """
+        if isinstance(valor, dict):
+            return {chave: self.resolver(v) for chave, v in valor.items()}
+        if isinstance(valor, (list, tuple)):
+            return [self.resolver(v) for v in valor]
+        if isinstance(valor, str):
+            partes = [parte.strip() for parte in valor.split(",")]
+            paths = [self.__resolver_handle(parte) for parte in partes]
+            if not any(paths):
+                return valor
+            return ",".join(path or parte for path, parte in zip(paths, partes))
+        return valor
+
+    def compactar(self, resultado: Any) -> str:
+        """
+        Observação compacta do resultado de uma ferramenta: cada arquivo existente é registrado e representado
+        pelo handle e pelo nome, e os caminhos registrados citados em mensagens são trocados pelos handles.
+        """
+        if isinstance(resultado, (list, tuple)):
+            return "; ".join(self.compactar(item) for item in resultado)
+        if isinstance(resultado, dict):
+            return ", ".join(f"{chave}: {self.compactar(valor)}" for chave, valor in resultado.items())
+        if resultado is None:
+            return ""
+
+        texto = str(resultado)
+        if os.path.isfile(texto):
+            return f"{self.registrar(texto)}={os.path.basename(texto)}"
+
+        with self.__lock:
+            registrados = sorted(self.__handles.items(), key=lambda item: -len(item[0]))
+        for path, handle in registrados:
+            texto = texto.replace(path, handle)
+        return texto
+
+    def como_dict(self) -> dict:
+        with self.__lock:
+            return dict(self.__paths)
+
+    def salvar(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.como_dict(), f, ensure_ascii=False, indent=2)
+        logger.info("Registro de artefatos do agente gravado em %s.", path)
+
+    def __resolver_handle(self, texto: str) -> Optional[str]:
+        encontrado = _PADRAO_ARTEFATO.match(texto)
+        return self.path(encontrado.group(1)) if encontrado else None
+
+
+class FerramentaCompacta(BaseTool):
+    """
+    Envolve uma ferramenta do agente trocando os handles dos argumentos pelos caminhos dos arquivos e compactando
+    o resultado com o registro de artefatos. O resultado das ferramentas com return_direct, que é a resposta
+    final do agente, é mantido.
+    """
+
+    ferramenta: BaseTool
+    artefatos: RegistroArtefatos
+
+    def __init__(self, ferramenta: BaseTool, artefatos: RegistroArtefatos, **kwargs):
+        super().__init__(
+            name=ferramenta.name,
+            description=ferramenta.description,
+            args_schema=ferramenta.args_schema or ferramenta.get_input_schema(),
+            return_direct=ferramenta.return_direct,
+            ferramenta=ferramenta,
+            artefatos=artefatos,
+            **kwargs,
+        )
+
+    def _run(
+        self,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        **kwargs,
+    ) -> Any:
+
+        resultado = self.ferramenta._run(**self.artefatos.resolver(kwargs), run_manager=run_manager)
+        return self.__observacao(resultado)
+
+    async def _arun(
+        self,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+        **kwargs,
+    ) -> Any:
+
+        resultado = await self.ferramenta._arun(**self.artefatos.resolver(kwargs), run_manager=run_manager)
+        return self.__observacao(resultado)
+
+    def __observacao(self, resultado: Any) -> Any:
+        if self.return_direct:
+            return resultado
+        return self.artefatos.compactar(resultado)
+
+
+class CompactadorScratchpad:
+    """
+    Mantém as ações e observações anteriores reenviadas à LLM a cada turno do agente ReAct dentro do orçamento
+    de tokens (usado como trim_intermediate_steps do AgentExecutor). As observações longas são truncadas e, se o
+    scratchpad ainda exceder o orçamento, os passos mais antigos são reduzidos à ação executada e ao início da
+    observação, preservando o último passo por inteiro. O tamanho estimado do scratchpad de cada turno é
+    registrado na execução instrumentada em andamento.
+    """
+
+    def __init__(
+        self,
+        orcamento_tokens: int = ORCAMENTO_TOKENS_SCRATCHPAD,
+        max_caracteres_observacao: int = MAX_CARACTERES_OBSERVACAO,
+    ):
+        self.orcamento_tokens = orcamento_tokens
+        self.max_caracteres_observacao = max_caracteres_observacao
+        self.turnos: List[dict] = []
+
+    def __call__(self, passos: List[tuple[AgentAction, str]]) -> List[tuple[AgentAction, str]]:
+        passos = [(acao, truncar(str(observacao), self.max_caracteres_observacao)) for acao, observacao in passos]
+        tokens_originais = tokens = sum(self.__tokens(acao, observacao) for acao, observacao in passos)
+
+        reduzidos = 0
+        for i, (acao, observacao) in enumerate(passos[:-1]):
+            if tokens <= self.orcamento_tokens:
+                break
+            reduzido = (
+                AgentAction(acao.tool, acao.tool_input, f"Action: {acao.tool}\nAction Input: {acao.tool_input}\n"),
+                truncar(observacao, CARACTERES_RESUMO_OBSERVACAO),
+            )
+            tokens -= self.__tokens(acao, observacao) - self.__tokens(*reduzido)
+            passos[i] = reduzido
+            reduzidos += 1
+
+        turno = {
+            "turno": len(self.turnos) + 1,
+            "passos": len(passos),
+            "passos_reduzidos": reduzidos,
+            "tokens_scratchpad": tokens,
+            "tokens_scratchpad_sem_compactacao": tokens_originais,
+        }
+        self.turnos.append(turno)
+        instrumentacao.registrar_turno(turno)
+        logger.info(
+            "Turno %d do agente: scratchpad com ~%d tokens em %d passos (%d reduzidos, orçamento %d).",
+            turno["turno"],
+            tokens,
+            len(passos),
+            reduzidos,
+            self.orcamento_tokens,
+        )
+
+        return passos
+
+    @staticmethod
+    def __tokens(acao: AgentAction, observacao: str) -> int:
+        # O scratchpad é o log de cada ação seguido de "\nObservation: " e da observação.
+        return estimar_tokens(acao.log) + estimar_tokens(observacao) + 3
+
+
+def truncar(texto: str, max_caracteres: int) -> str:
+    if len(texto) <= max_caracteres:
+        return texto
+    return f"{texto[:max_caracteres]}... ({len(texto) - max_caracteres} caracteres omitidos)"
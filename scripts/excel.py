@@ -1,25 +1,377 @@
+import itertools
 import logging
-from typing import Optional, Tuple
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from copy import copy
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
 
+import numpy as np
 import openpyxl
 import pandas as pd
-from fuzzywuzzy import fuzz
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import column_index_from_string, coordinate_to_tuple, get_column_letter, range_boundaries
 from openpyxl.worksheet.worksheet import Worksheet
 
+import cabecalhos
+import instrumentacao
+import similaridade
+
 logger = logging.getLogger(__name__)
 
+# Quantidade de linhas do topo de cada planilha em que o cabeçalho é procurado.
+MAX_LINHAS_CABECALHO = int(os.environ.get("MAX_LINHAS_CABECALHO", 10))
+
+# Quantidade máxima de processos usados na leitura paralela das planilhas.
+MAX_PROCESSOS_LEITURA = int(os.environ.get("MAX_PROCESSOS_LEITURA", os.cpu_count() or 1))
+
+# Tamanho total, em MB, das planilhas em Excel a partir do qual elas são lidas em paralelo. Cada processo de
+# leitura importa o pandas e o openpyxl ao iniciar, o que custa mais que a leitura serial das planilhas pequenas.
+MIN_MB_LEITURA_PARALELA = float(os.environ.get("MIN_MB_LEITURA_PARALELA", 10))
+
+# Memória máxima ocupada pelas planilhas mantidas no cache.
+MAX_MB_CACHE_PLANILHAS = int(os.environ.get("MAX_MB_CACHE_PLANILHAS", 512))
+
+# Estimativa da memória ocupada por uma célula carregada pelo openpyxl.
+BYTES_POR_CELULA = 400
+
+# Extensões das planilhas intermediárias gravadas em formato binário colunar.
+EXTENSOES_COLUNARES = (".parquet",)
+
+# Quantidade de linhas de dados, além do cabeçalho, usadas no cálculo das larguras das colunas da planilha final
+# (0 para usar todas as linhas).
+LINHAS_AMOSTRA_LARGURAS = int(os.environ.get("LINHAS_AMOSTRA_LARGURAS", 10000))
+
+# Quantidade de linhas passadas de cada vez para o cálculo vetorizado das colunas da planilha final.
+TAMANHO_BLOCO_CALCULO = 10000
+
+
+class CachePlanilhas:
+    """
+    Cache LRU de planilhas já interpretadas (workbooks do openpyxl, DataFrames e cabeçalhos), compartilhado
+    por todo o processo. As entradas são identificadas pelo caminho absoluto do arquivo junto com sua data
+    de modificação e tamanho, de modo que um arquivo alterado nunca é servido a partir do cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.__entradas: OrderedDict = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obter(
+        self,
+        tipo: str,
+        path: str,
+        carregar: Callable[[], Any],
+        estimar_bytes: Callable[[Any], int],
+        **kwargs,
+    ) -> Any:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        chave = (tipo, path, stat.st_mtime_ns, stat.st_size, tuple(sorted(kwargs.items())))
+
+        with self.__lock:
+            if chave in self.__entradas:
+                self.__entradas.move_to_end(chave)
+                self.hits += 1
+                logger.debug("Cache de planilhas: hit de %s em %s", tipo, path)
+                return self.__entradas[chave][0]
+            self.misses += 1
+
+        logger.debug("Cache de planilhas: miss de %s em %s", tipo, path)
+        valor = carregar()
+        num_bytes = estimar_bytes(valor)
+
+        with self.__lock:
+            self.__remover_path(path, tipo)
+            if num_bytes <= self.max_bytes:
+                self.__entradas[chave] = (valor, num_bytes)
+                self.__bytes += num_bytes
+                while self.__bytes > self.max_bytes:
+                    _, (_, bytes_removidos) = self.__entradas.popitem(last=False)
+                    self.__bytes -= bytes_removidos
+                    self.evictions += 1
+
+        return valor
+
+    def invalidar(self, path: Optional[str] = None) -> None:
+        with self.__lock:
+            if path is None:
+                self.__entradas.clear()
+                self.__bytes = 0
+            else:
+                self.__remover_path(os.path.abspath(path))
+
+    def estatisticas(self) -> dict:
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entradas": len(self.__entradas),
+                "bytes": self.__bytes,
+            }
+
+    def __remover_path(self, path: str, tipo: Optional[str] = None) -> None:
+        for chave in [
+            chave
+            for chave in self.__entradas
+            if chave[1] == path and (tipo is None or chave[0] == tipo)
+        ]:
+            self.__bytes -= self.__entradas.pop(chave)[1]
+
+
+__cache_planilhas = CachePlanilhas(MAX_MB_CACHE_PLANILHAS * 1024 * 1024)
+
+
+def carregar_workbook(path: str, **kwargs) -> openpyxl.Workbook:
+    """
+    Carrega o workbook através do cache de planilhas. O objeto retornado é compartilhado: quem for alterá-lo
+    deve usar alterar_workbook para que o cache seja invalidado.
+    """
+    return __cache_planilhas.obter(
+        "workbook",
+        path,
+        lambda: openpyxl.load_workbook(path, **kwargs),
+        lambda wb: BYTES_POR_CELULA * sum(len(ws._cells) for ws in wb.worksheets),
+        **kwargs,
+    )
+
+
+@contextmanager
+def alterar_workbook(path: str, **kwargs) -> Iterator[openpyxl.Workbook]:
+    """
+    Carrega o workbook para alteração, salvando-o ao final do bloco. Em caso de erro no bloco as alterações não
+    são salvas; em qualquer caso, inclusive de erro ao salvar, o workbook alterado é descartado do cache.
+    """
+    wb = carregar_workbook(path, **kwargs)
+    try:
+        yield wb
+    except BaseException:
+        invalidar_cache(path)
+        raise
+    salvar_workbook(wb, path)
+
+
+@instrumentacao.medir
+def salvar_workbook(wb: openpyxl.Workbook, path: str) -> None:
+    # Se a gravação falhar, o arquivo mantém o mtime e o tamanho anteriores; sem a invalidação, o workbook alterado
+    # continuaria no cache sob a chave do arquivo antigo.
+    try:
+        wb.save(path)
+    finally:
+        invalidar_cache(path)
+
+
+@instrumentacao.medir
+def ler_excel(path: str, **kwargs) -> pd.DataFrame:
+    """
+    Equivalente a pd.read_excel através do cache de planilhas. Retorna uma cópia do DataFrame em cache.
+    Planilhas em formato colunar são lidas como se tivessem sido gravadas em Excel com to_excel.
+    """
+    if e_planilha_colunar(path):
+        df = __ler_planilha_colunar(path, **kwargs)
+    else:
+        df = __cache_planilhas.obter(
+            "dataframe",
+            path,
+            lambda: pd.read_excel(path, **kwargs),
+            __estimar_bytes_dataframe,
+            **kwargs,
+        ).copy()
+    instrumentacao.registrar_linhas(len(df))
+    return df
+
+
+def ler_linhas_planilha(path: str) -> list[tuple]:
+    """
+    Retorna os valores de todas as linhas da planilha, incluindo a de cabeçalho, como no
+    iter_rows(values_only=True) do openpyxl, tanto para planilhas em Excel quanto em formato colunar.
+    """
+    if not e_planilha_colunar(path):
+        return list(carregar_workbook(path).active.iter_rows(values_only=True))
+
+    df = __ler_dataframe_colunar(path)
+    layout = __como_planilha(df)
+    cabecalho = tuple([df.index.name] + list(df.columns))
+    valores = layout.astype(object).where(layout.notna(), None)
+
+    return [cabecalho] + list(valores.itertuples(index=False, name=None))
+
+
+def iterar_linhas_planilha(path: str) -> Iterator[tuple]:
+    """
+    Versão de ler_linhas_planilha que lê a planilha em blocos, sem passar pelo cache e sem manter as linhas em
+    memória, de modo que uma planilha grande possa ser percorrida mais de uma vez com memória constante.
+    """
+    if not e_planilha_colunar(path):
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            largura = None
+            for linha in wb.active.iter_rows(values_only=True):
+                # No modo read-only, as linhas podem ter menos células que a de cabeçalho.
+                largura = largura or len(linha)
+                yield linha + (None,) * (largura - len(linha))
+        finally:
+            wb.close()
+        return
+
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(path)
+
+    # Um RangeIndex é gravado apenas nos metadados e não é reconstruído na leitura em blocos.
+    indices = (arquivo.schema_arrow.pandas_metadata or {}).get("index_columns", [])
+    intervalo = indices[0] if len(indices) == 1 and isinstance(indices[0], dict) else None
+
+    vazio = arquivo.schema_arrow.empty_table().to_pandas()
+    yield tuple([intervalo["name"] if intervalo else vazio.index.name] + list(vazio.columns))
+
+    num_linhas = 0
+    for lote in arquivo.iter_batches(batch_size=TAMANHO_BLOCO_CALCULO):
+        df = lote.to_pandas()
+        if intervalo:
+            inicio = intervalo["start"] + intervalo["step"] * num_linhas
+            df.index = pd.RangeIndex(
+                inicio, inicio + intervalo["step"] * len(df), intervalo["step"], name=intervalo["name"]
+            )
+        num_linhas += len(df)
+        layout = __como_planilha(df)
+        yield from layout.astype(object).where(layout.notna(), None).itertuples(index=False, name=None)
+
+
+def __linha_planilha(path: str, num_linha: int) -> tuple:
+    linhas = iterar_linhas_planilha(path)
+    try:
+        return next(itertools.islice(linhas, num_linha - 1, None))
+    finally:
+        linhas.close()
+
+
+@instrumentacao.medir
+def gravar_planilha(df: pd.DataFrame, path: str) -> str:
+    """
+    Grava o DataFrame em Excel ou, conforme a extensão do caminho, em formato colunar. Caso o formato colunar
+    não esteja disponível ou não suporte os dados, a planilha é gravada em Excel com a extensão .xlsx.
+    Retorna o caminho do arquivo gravado.
+    """
+    if e_planilha_colunar(path):
+        try:
+            df.to_parquet(path)
+            invalidar_cache(path)
+            instrumentacao.registrar_linhas(len(df))
+            return path
+        except (ImportError, ValueError, TypeError) as e:
+            logger.warning(
+                "Não foi possível gravar %s em formato colunar (%s). Gravando em Excel...", path, e
+            )
+            path = os.path.splitext(path)[0] + ".xlsx"
+
+    df.to_excel(path)
+    invalidar_cache(path)
+    instrumentacao.registrar_linhas(len(df))
+
+    return path
+
+
+def converter_para_xlsx(path: str, path_destino: Optional[str] = None) -> str:
+    """
+    Converte uma planilha intermediária em formato colunar para Excel, por exemplo para inspecioná-la.
+    """
+    if not e_planilha_colunar(path):
+        return path
+
+    return gravar_planilha(
+        __ler_dataframe_colunar(path), path_destino or os.path.splitext(path)[0] + ".xlsx"
+    )
+
 
+def e_planilha_colunar(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in EXTENSOES_COLUNARES
+
+
+def __ler_dataframe_colunar(path: str) -> pd.DataFrame:
+    return __cache_planilhas.obter(
+        "dataframe", path, lambda: pd.read_parquet(path), __estimar_bytes_dataframe
+    ).copy()
+
+
+def __ler_planilha_colunar(path: str, skiprows: Optional[int] = None, index_col: Optional[int] = None) -> pd.DataFrame:
+    # O cabeçalho de uma planilha colunar está sempre na primeira linha.
+    if skiprows:
+        raise ValueError(f"A planilha {path} não possui linhas acima do cabeçalho.")
+
+    df = __ler_dataframe_colunar(path)
+    if index_col == 0:
+        return df
+
+    df = __como_planilha(df)
+    if index_col is not None:
+        df = df.set_index(df.columns[index_col])
+
+    return df
+
+
+def __estimar_bytes_dataframe(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def invalidar_cache(path: Optional[str] = None) -> None:
+    """
+    Descarta do cache as entradas do arquivo informado ou, sem argumentos, todas as entradas.
+    """
+    __cache_planilhas.invalidar(path)
+
+
+def estatisticas_cache() -> dict:
+    return __cache_planilhas.estatisticas()
+
+
+@instrumentacao.medir
 def remover_registros_planilha_por_valores_especificos_coluna(planilha_origem: str,token: str,valores:list[str],indice_planilha_origem=1) -> str:
 
-    wb_origem = openpyxl.load_workbook(planilha_origem)
-    ws_origem = wb_origem.active
-    __remover_registros_worksheets_por_valores_especificos_coluna(ws_origem,token,valores,indice_planilha_origem)
+    if e_planilha_colunar(planilha_origem):
+        df = __ler_dataframe_colunar(planilha_origem)
+        instrumentacao.registrar_linhas(len(df))
+        filtrado = remover_registros_dataframe_por_valores_especificos_coluna(__como_planilha(df),token,valores)
+        if len(filtrado) < len(df):
+            return gravar_planilha(df.iloc[filtrado.index], planilha_origem)
+        return planilha_origem
 
-    wb_origem.save(planilha_origem)
+    with alterar_workbook(planilha_origem) as wb_origem:
+        ws_origem = wb_origem.active
+        instrumentacao.registrar_linhas(max(ws_origem.max_row - indice_planilha_origem, 0))
+        __remover_registros_worksheets_por_valores_especificos_coluna(ws_origem,token,valores,indice_planilha_origem)
 
     return planilha_origem
     
 
+def remover_registros_dataframe_por_valores_especificos_coluna(df: pd.DataFrame, token: str, valores: list[str]) -> pd.DataFrame:
+    """
+    Versão em DataFrame da remoção de registros: retorna um novo DataFrame sem as linhas cujas colunas
+    similares ao token casam com algum dos valores informados.
+    """
+
+    indices = __buscar_todos_indices_por_similaridade(token, list(df.columns))
+
+    if not indices:
+        return df
+
+    logger.debug("Todos os indices: %s", indices)
+    manter = __calcular_mascara_registros(
+        df.itertuples(index=False, name=None), indices, valores
+    )
+
+    return df[manter]
+
+
 def __remover_registros_worksheets_por_valores_especificos_coluna(ws_origem: type[Worksheet], token: str,valores:list[str],indice_planilha_origem=1) -> None:
 
     first_row_origem = ws_origem[indice_planilha_origem]
@@ -29,23 +381,81 @@ def __remover_registros_worksheets_por_valores_especificos_coluna(ws_origem: typ
     if indices:
         logger.debug("Todos os indices: %s",indices)
         for i in indices:
-            nome_coluna = first_row_origem[i].value
-            logger.debug("O nome da coluna que encontrei se chama %s",nome_coluna)
-            for row_index in range(indice_planilha_origem+1, ws_origem.max_row+1):
-                valor_celula = ws_origem.cell(row=row_index,column=i+1).value
-                logger.debug("valor da celula [%d,%d] = %s",row_index,i+1,valor_celula)
-                if valor_celula!=None:
-                    for valor in valores:
-                        score = fuzz.ratio(valor.strip().lower(), str(valor_celula).strip().lower())
-                        if (score>50):
-                            logger.debug("O valor %s casa com o valor %s!",valor_celula,valor)
-                            ws_origem.delete_rows(row_index,1)
-                            __remover_registros_worksheets_por_valores_especificos_coluna(ws_origem,token,valores,indice_planilha_origem)
-                            return 
-        
+            logger.debug("O nome da coluna que encontrei se chama %s",first_row_origem[i].value)
+
+        manter = __calcular_mascara_registros(
+            ws_origem.iter_rows(min_row=indice_planilha_origem + 1, values_only=True),
+            indices,
+            valores,
+        )
+
+        if not all(manter):
+            compactar_linhas(ws_origem, manter, indice_planilha_origem + 1)
+
+
+def __calcular_mascara_registros(linhas: Iterable[tuple], indices: tuple, valores: list[str]) -> list[bool]:
+    """
+    Percorre as linhas uma única vez e retorna, para cada uma, se ela deve ser mantida, ou seja, se nenhuma
+    das colunas indicadas casa com algum dos valores. Os valores distintos das células são pontuados de uma
+    só vez contra todos os valores.
+    """
+
+    celulas = [
+        [
+            similaridade.normalizar(linha[i]) if linha[i] is not None else None
+            for i in indices
+        ]
+        for linha in linhas
+    ]
+
+    palavras = list({palavra for linha in celulas for palavra in linha if palavra is not None})
+    scores = similaridade.matriz_similaridade(valores, palavras, "ratio", 50)
+    casamentos = dict(zip(palavras, (scores > 50).any(axis=0)))
 
+    return [
+        not any(palavra is not None and casamentos[palavra] for palavra in linha)
+        for linha in celulas
+    ]
 
 
+def compactar_linhas(ws: type[Worksheet], manter: list[bool], linha_inicial: int) -> int:
+    """
+    Remove de uma só vez as linhas descartadas a partir de linha_inicial (manter[k] refere-se à linha
+    linha_inicial + k), movendo as linhas mantidas e as linhas seguintes para cima de forma contígua.
+    Equivale a chamar ws.delete_rows para cada linha descartada, porém em uma única passagem.
+    Retorna a quantidade de linhas removidas.
+    """
+
+    colunas_por_linha = defaultdict(list)
+    for row, column in ws._cells:
+        if row >= linha_inicial:
+            colunas_por_linha[row].append(column)
+
+    # Quantidade de linhas descartadas antes de cada linha do intervalo:
+    descartadas_antes = []
+    removidas = 0
+    for mantida in manter:
+        descartadas_antes.append(removidas)
+        if not mantida:
+            removidas += 1
+
+    for row in sorted(colunas_por_linha):
+        k = row - linha_inicial
+        if k < len(manter) and not manter[k]:
+            for column in colunas_por_linha[row]:
+                del ws._cells[(row, column)]
+            continue
+        deslocamento = descartadas_antes[k] if k < len(manter) else removidas
+        if deslocamento:
+            for column in colunas_por_linha[row]:
+                ws._move_cell(row, column, -deslocamento, 0)
+
+    ws._current_row = ws.max_row
+
+    return removidas
+
+
+@instrumentacao.medir
 def preencher_planilha(
     planilha_origem: str,
     planilha_destino: str,
@@ -58,180 +468,497 @@ def preencher_planilha(
         f"Preenchendo os dados oriundos da planilha {planilha_origem} na planilha final em {planilha_destino} ..."
     )
 
-    wb_destino = openpyxl.load_workbook(planilha_destino)
-    ws_destino = wb_destino.active
+    linhas_origem = ler_linhas_planilha(planilha_origem)
+
+    with alterar_workbook(planilha_destino) as wb_destino:
+        ws_destino = wb_destino.active
+
+        num_primeira_linha_nao_preenchida = index_first_empty_row(ws_destino)
+        logger.debug(
+            "Primeira linha nao preenchida na planilha destino é %d",
+            num_primeira_linha_nao_preenchida,
+        )
+
+        if max_col_planilha_destino:
+            first_row_destino = ws_destino[indice_planilha_destino][
+                0:max_col_planilha_destino
+            ]
+        else:
+            first_row_destino = ws_destino[indice_planilha_destino]
+
+        mapeamento = __mapear_colunas(linhas_origem[indice_planilha_origem - 1], first_row_destino)
+        num_linhas = copiar_colunas(
+            linhas_origem,
+            ws_destino,
+            mapeamento,
+            indice_planilha_origem,
+            num_primeira_linha_nao_preenchida,
+        )
+    instrumentacao.registrar_linhas(num_linhas)
+
+    return planilha_destino
+
+
+def copiar_colunas(
+    linhas_origem: Iterable[tuple],
+    ws_destino: type[Worksheet],
+    mapeamento: list[Tuple[int, int]],
+    skiprows_origem: int = 0,
+    linha_inicial_destino: int = 1,
+) -> int:
+    """
+    Copia de uma só vez todas as colunas do mapeamento, pares (coluna de origem, coluna destino) indexados a
+    partir de 0, linha a linha: cada linha de origem é lida uma única vez e escrita inteira na linha destino,
+    preservando os estilos das células já existentes. Retorna a quantidade de linhas copiadas.
+    """
+    colunas = [(j_origem, j_destino + 1) for j_origem, j_destino in mapeamento]
 
-    wb_origem = openpyxl.load_workbook(planilha_origem)
-    ws_origem = wb_origem.active
+    num_linhas = 0
+    for row, linha in enumerate(
+        itertools.islice(linhas_origem, skiprows_origem, None), start=linha_inicial_destino
+    ):
+        for j_origem, column in colunas:
+            ws_destino.cell(row=row, column=column).value = linha[j_origem]
+        num_linhas += 1
 
-    i = index_first_empty_row(ws_destino)
-    num_primeira_linha_nao_preenchida = i
     logger.debug(
-        "Primeira linha nao preenchida na planilha destino é %d",
-        num_primeira_linha_nao_preenchida,
+        "%d linhas copiadas para a planilha destino a partir da linha %d.", num_linhas, linha_inicial_destino
     )
 
-    first_row_origem = ws_origem[indice_planilha_origem]
+    return num_linhas
 
-    if max_col_planilha_destino:
-        first_row_destino = ws_destino[indice_planilha_destino][
-            0:max_col_planilha_destino
-        ]
-    else:
-        first_row_destino = ws_destino[indice_planilha_destino]
+@instrumentacao.medir
+def escrever_planilha_final(
+    planilha_origem: str,
+    planilha_modelo: str,
+    planilha_destino: Optional[str] = None,
+    indice_planilha_origem: int = 1,
+    indice_planilha_destino: int = 1,
+    max_col_planilha_destino: Optional[int] = None,
+    valores_colunas: Optional[dict[str, Any]] = None,
+    colunas_obrigatorias: Iterable[str] = (),
+    formulas_linhas: Optional[dict[str, str]] = None,
+    formulas_celulas: Optional[dict[str, str]] = None,
+    num_linhas_amostra_larguras: Optional[int] = LINHAS_AMOSTRA_LARGURAS,
+    calcular_colunas: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> str:
+    """
+    Gera a planilha final a partir da planilha modelo em uma única passagem, com o openpyxl em modo write-only.
+    As linhas do modelo até a primeira linha vazia são copiadas uma vez, com seus estilos, e em seguida os
+    registros da planilha de origem são sobrepostos às linhas seguintes do modelo, mantendo seus valores e
+    estilos (além do fim do modelo, o estilo da primeira linha vazia). Nas linhas novas:
 
-    for j_origem in range(len(first_row_origem)):
-        cell_origem = first_row_origem[j_origem]
-        j_destino = buscar_indice_row_por_similaridade(
-            cell_origem.value, first_row_destino
-        )
-        if j_destino != None:
-            logger.debug(
-                "Copiando os dados da coluna de origem de nome %s para a coluna destino de nome %s",
-                cell_origem.value,
-                first_row_destino[j_destino].value,
-            )
-            __copiar_coluna(
-                ws_origem,
-                ws_destino,
-                j_origem + 1,
-                j_destino + 1,
-                2,
-                num_primeira_linha_nao_preenchida,
-            )
+    - as colunas de origem são copiadas para as colunas de nomes similares do cabeçalho do modelo;
+    - valores_colunas preenche as colunas de nomes similares aos informados com um valor fixo;
+    - as linhas em que alguma das colunas_obrigatorias está vazia são descartadas.
 
-    wb_destino.save(planilha_destino)
+    calcular_colunas recebe blocos das linhas novas como DataFrame, com os nomes das colunas do cabeçalho do
+    modelo, e retorna as colunas calculadas, escritas nas colunas de nomes similares.
 
-def buscar_todos_indices_row_por_similaridade(word: str, row: type[tuple]) -> Optional[tuple]:
+    formulas_linhas ("G": "=$E{linha}*$F{linha}") é aplicado em todas as linhas abaixo do cabeçalho e
+    formulas_celulas ("G1": "=SUM($G2:$G{ultima_linha})") nas células informadas. O arquivo é salvo uma única
+    vez. As demais abas do modelo são copiadas sem alterações. Retorna o caminho da planilha gravada, por padrão
+    o da própria planilha modelo.
 
-    indices = []
+    A planilha de origem é lida duas vezes, em blocos, sem manter as linhas em memória: a primeira passagem
+    conta as linhas e acumula as larguras das colunas, medindo as linhas do modelo e, se
+    num_linhas_amostra_larguras for informado, apenas as primeiras linhas novas; a segunda escreve as linhas.
+    As colunas calculadas são obtidas uma única vez por bloco: na primeira passagem, enquanto a amostra das
+    larguras não estiver completa, e guardadas para a escrita; os demais blocos, imediatamente antes da escrita.
+    """
+    planilha_destino = planilha_destino or planilha_modelo
 
-    for j in range(len(row)):
-        cell = row[j]
-        logger.debug("Valor da celula: %s", cell.value)
-        if cell.data_type == "s":
-            word_cell = cell.value
-            logger.debug(
-                "Verificando se a palavra %s da linha destino casa com a palavra %s...",
-                word_cell,
-                word,
+    logger.info(
+        f"Gerando a planilha final {planilha_destino} a partir do modelo {planilha_modelo} e dos dados de {planilha_origem} ..."
+    )
+
+    wb_modelo = carregar_workbook(planilha_modelo)
+    ws_modelo = wb_modelo.active
+
+    num_colunas = ws_modelo.max_column
+    cabecalho_destino = ws_modelo[indice_planilha_destino]
+    primeira_linha_vazia = index_first_empty_row(ws_modelo)
+
+    mapeamento = __mapear_colunas(
+        __linha_planilha(planilha_origem, indice_planilha_origem),
+        cabecalho_destino[:max_col_planilha_destino] if max_col_planilha_destino else cabecalho_destino,
+    )
+    valores_fixos = []
+    for nome, valor in (valores_colunas or {}).items():
+        j = buscar_indice_row_por_similaridade(nome, cabecalho_destino)
+        if j is None:
+            raise ValueError(f"A coluna {nome} não foi encontrada na planilha {planilha_modelo}.")
+        valores_fixos.append((j, valor))
+    obrigatorias = [buscar_indice_row_por_similaridade(nome, cabecalho_destino) for nome in colunas_obrigatorias]
+
+    def linhas_mapeadas() -> Iterator[Tuple[int, list]]:
+        # Os dados são sobrepostos às linhas do modelo, preservando os valores do modelo nas demais colunas, e as
+        # linhas incompletas são descartadas. Retorna também a linha do modelo usada em cada linha nova.
+        for num_linha_modelo, linha_origem in enumerate(
+            itertools.islice(iterar_linhas_planilha(planilha_origem), indice_planilha_origem, None),
+            start=primeira_linha_vazia,
+        ):
+            valores = [__valor_celula(ws_modelo, num_linha_modelo, j) for j in range(1, num_colunas + 1)]
+            for j_origem, j_destino in mapeamento:
+                valores[j_destino] = linha_origem[j_origem]
+            if any(valores[j] is None for j in obrigatorias):
+                continue
+            for j, valor in valores_fixos:
+                valores[j] = valor
+            yield num_linha_modelo, valores
+
+    # Colunas calculadas dos blocos obtidos na passagem das larguras, reaproveitadas na escrita: calcular_colunas
+    # é chamado uma única vez por linha, pois pode acumular valores (como os totais) a cada chamada.
+    blocos_calculados: list[list[Tuple[int, list]]] = []
+
+    def linhas_novas(calcular: Callable[[], bool] = lambda: True, guardar: bool = False) -> Iterator[Tuple[int, list]]:
+        # As colunas calculadas são obtidas bloco a bloco, quando calcular() é verdadeiro no início do bloco, e
+        # guardadas em blocos_calculados se guardar for verdadeiro.
+        mapeadas = linhas_mapeadas()
+        if calcular_colunas is None:
+            yield from mapeadas
+            return
+
+        for num_bloco in itertools.count():
+            bloco = list(itertools.islice(mapeadas, TAMANHO_BLOCO_CALCULO))
+            if not bloco:
+                return
+            if num_bloco < len(blocos_calculados):
+                colunas = blocos_calculados[num_bloco]
+            elif calcular():
+                colunas = __calcular_bloco(bloco, cabecalho_destino, calcular_colunas)
+                if guardar:
+                    blocos_calculados.append(colunas)
+            else:
+                colunas = []
+            for j, valores_coluna in colunas:
+                for (_, valores), valor in zip(bloco, valores_coluna):
+                    valores[j] = valor
+            yield from bloco
+
+    formulas = [
+        (column_index_from_string(coluna) - 1, formula)
+        for coluna, formula in (formulas_linhas or {}).items()
+    ]
+
+    def aplicar_formulas(num_linha: int, valores: list) -> list:
+        if num_linha > indice_planilha_destino:
+            for j, formula in formulas:
+                valores[j] = formula.format(linha=num_linha)
+        for j, formula in formulas_fixas.get(num_linha, ()):
+            valores[j] = formula
+        return valores
+
+    # Uma passagem prévia pelas linhas novas conta as linhas e acumula as larguras das colunas, que no modo
+    # write-only precisam ser definidas antes da escrita das linhas.
+    larguras = LargurasColunas(num_linhas_amostra_larguras)
+    formulas_fixas = {}
+    ultima_linha = primeira_linha_vazia - 1
+    for _, valores in linhas_novas(lambda: not larguras.amostra_completa, guardar=True):
+        ultima_linha += 1
+        larguras.atualizar(aplicar_formulas(ultima_linha, valores))
+
+    for coordenada, formula in (formulas_celulas or {}).items():
+        linha, coluna = coordinate_to_tuple(coordenada)
+        formulas_fixas.setdefault(linha, []).append((coluna - 1, formula.format(ultima_linha=ultima_linha)))
+        larguras.atualizar_celula(coluna - 1, formulas_fixas[linha][-1][1])
+
+    linhas_modelo = [
+        aplicar_formulas(num_linha, [__valor_celula(ws_modelo, num_linha, j) for j in range(1, num_colunas + 1)])
+        for num_linha in range(1, primeira_linha_vazia)
+    ]
+    for valores in linhas_modelo:
+        larguras.atualizar(valores, amostra=False)
+
+    def linhas() -> Iterator[Tuple[int, int, list]]:
+        """
+        Linhas da planilha final como (linha, linha do modelo, valores), já com as fórmulas.
+        """
+        for num_linha, valores in enumerate(linhas_modelo, start=1):
+            yield num_linha, num_linha, valores
+        for num_linha, (num_linha_modelo, valores) in enumerate(linhas_novas(), start=primeira_linha_vazia):
+            yield num_linha, num_linha_modelo, aplicar_formulas(num_linha, valores)
+
+    wb = openpyxl.Workbook(write_only=True)
+    for ws_origem in wb_modelo.worksheets:
+        ws = wb.create_sheet(ws_origem.title)
+        __copiar_propriedades_worksheet(ws_origem, ws)
+        estilos = {}
+
+        if ws_origem is not ws_modelo:
+            for num_linha in range(1, ws_origem.max_row + 1):
+                ws.append(
+                    __linha_estilizada(
+                        ws,
+                        [__valor_celula(ws_origem, num_linha, j) for j in range(1, ws_origem.max_column + 1)],
+                        __prototipos_linha(ws, ws_origem, num_linha, ws_origem.max_column, estilos),
+                    )
+                )
+            continue
+
+        larguras.aplicar(ws)
+
+        # O filtro do modelo cobre as suas linhas pré-formatadas; na planilha final, cobre as linhas escritas.
+        if ws.auto_filter.ref:
+            min_col, min_row, max_col, _ = range_boundaries(ws.auto_filter.ref)
+            ws.auto_filter.ref = (
+                f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max(ultima_linha, min_row)}"
             )
-            score = fuzz.partial_ratio(
-                word.strip().lower(), str(word_cell).strip().lower()
+
+        # As linhas novas além do fim do modelo usam o estilo da primeira linha vazia.
+        prototipos_padrao = __prototipos_linha(ws, ws_modelo, primeira_linha_vazia, num_colunas, estilos)
+        for num_linha, num_linha_modelo, valores in linhas():
+            prototipos = __prototipos_linha(
+                ws,
+                ws_modelo,
+                num_linha_modelo,
+                num_colunas,
+                estilos,
+                prototipos_padrao if num_linha_modelo >= primeira_linha_vazia else None,
             )
-            if score > 90:
-                score_full = fuzz.ratio(
-                    word.strip().lower(), str(word_cell).strip().lower()
-                )
-                logger.debug(
-                    "As palavras %s e %s possuem o score %d e score-full %d. O indice da coluna é %d",
-                    word,
-                    word_cell,
-                    score,
-                    score_full,
-                    j,
-                )
-                indices.append(j)
+            ws.append(__linha_estilizada(ws, valores, prototipos))
+    wb.active = wb_modelo.index(ws_modelo)
 
-    return tuple(indices)
+    wb.save(planilha_destino)
+    invalidar_cache(planilha_destino)
+    instrumentacao.registrar_linhas(ultima_linha)
 
+    logger.info(f"Planilha {planilha_destino} gerada com {ultima_linha} linhas.")
 
-def buscar_indice_row_por_similaridade(word: str, row: type[tuple]) -> Optional[int]:
+    return planilha_destino
+
+
+def __calcular_bloco(
+    bloco: list[Tuple[int, list]], cabecalho: tuple, calcular_colunas: Callable[[pd.DataFrame], pd.DataFrame]
+) -> list[Tuple[int, list]]:
+    nomes = [cell.value for cell in cabecalho]
+    df = pd.DataFrame([valores[: len(nomes)] for _, valores in bloco], columns=nomes)
+
+    colunas = []
+    for nome, serie in calcular_colunas(df).items():
+        j = nomes.index(nome) if nome in nomes else buscar_indice_row_por_similaridade(nome, cabecalho)
+        if j is None:
+            raise ValueError(f"A coluna calculada {nome} não existe na planilha modelo.")
+        colunas.append((j, [None if pd.isna(valor) else valor for valor in serie.tolist()]))
+
+    return colunas
 
-    for j in range(len(row)):
-        cell = row[j]
-        logger.debug("Valor da celula: %s", cell.value)
-        if cell.data_type == "s":
-            word_cell = cell.value
+
+def __mapear_colunas(cabecalho_origem: tuple, cabecalho_destino: tuple) -> list[Tuple[int, int]]:
+    """
+    Pares (coluna de origem, coluna destino), indexados a partir de 0, das colunas da origem cujo nome é
+    similar ao de uma coluna do cabeçalho destino.
+    """
+    mapeamento = []
+    for j_origem, nome_coluna_origem in enumerate(cabecalho_origem):
+        if nome_coluna_origem is None:
+            continue
+        j_destino = buscar_indice_row_por_similaridade(nome_coluna_origem, cabecalho_destino)
+        if j_destino is not None:
             logger.debug(
-                "Verificando se a palavra %s da linha destino casa com a palavra %s...",
-                word_cell,
-                word,
-            )
-            score = fuzz.partial_ratio(
-                word.strip().lower(), str(word_cell).strip().lower()
+                "Copiando os dados da coluna de origem de nome %s para a coluna destino de nome %s",
+                nome_coluna_origem,
+                cabecalho_destino[j_destino].value,
             )
-            if score > 90:
-                score_full = fuzz.ratio(
-                    word.strip().lower(), str(word_cell).strip().lower()
-                )
-                logger.debug(
-                    "As palavras %s e %s possuem o score %d e score-full %d. O indice da coluna é %d",
-                    word,
-                    word_cell,
-                    score,
-                    score_full,
-                    j,
-                )
-                return j
+            mapeamento.append((j_origem, j_destino))
 
+    return mapeamento
 
-def __copiar_coluna(
-    ws_source: type[Worksheet],
-    ws_destino: type[Worksheet],
-    j_source: int,
-    j_destino: int,
-    skiprows_source: int = 1,
-    skip_rows_destino: int = 1,
-) -> None:
 
-    row_init_origem = skiprows_source
-    row_fim_origem = ws_source.max_row + 1
+def __valor_celula(ws: type[Worksheet], row: int, column: int) -> Any:
+    # Consulta direta às células existentes, sem criar células vazias no workbook em cache.
+    celula = ws._cells.get((row, column))
+    return celula.value if celula is not None else None
 
-    row_init_destino = skip_rows_destino
 
-    logger.debug(
-        "Copiando a coluna %d do ws origem para a coluna %d do ws destino a partir da linha %d:%d da planilha de origem começando na linha %d na planilha destino.",
-        j_source,
-        j_destino,
-        row_init_origem,
-        row_fim_origem,
-        row_init_destino,
+def __prototipos_linha(
+    ws: Any,
+    ws_modelo: type[Worksheet],
+    row: int,
+    num_colunas: int,
+    estilos: dict,
+    prototipos_padrao: Optional[list] = None,
+) -> list:
+    """
+    Células do worksheet write-only com os estilos das células da linha do modelo ou, nas colunas sem célula no
+    modelo, as de prototipos_padrao. Cada estilo do modelo é registrado no workbook novo uma única vez, no dict
+    estilos, e depois apenas referenciado pelas células escritas.
+    """
+    prototipos = []
+    for column in range(1, num_colunas + 1):
+        celula_modelo = ws_modelo._cells.get((row, column))
+        if celula_modelo is None:
+            prototipos.append(prototipos_padrao[column - 1] if prototipos_padrao else None)
+            continue
+        if celula_modelo._style is None:
+            prototipos.append(None)
+            continue
+        chave = tuple(celula_modelo._style)
+        if chave not in estilos:
+            estilos[chave] = WriteOnlyCell(ws)
+            __copiar_estilo(celula_modelo, estilos[chave])
+        prototipos.append(estilos[chave])
+
+    return prototipos
+
+
+def __linha_estilizada(ws: Any, valores: list, prototipos: list) -> list:
+    celulas = []
+    for valor, prototipo in zip(valores, prototipos):
+        if prototipo is None and valor is None:
+            celulas.append(None)
+            continue
+        celula = WriteOnlyCell(ws, valor)
+        if prototipo is not None:
+            celula._style = copy(prototipo._style)
+        celulas.append(celula)
+
+    return celulas
+
+
+def __copiar_estilo(origem: Any, destino: Any) -> None:
+    destino.font = copy(origem.font)
+    destino.fill = copy(origem.fill)
+    destino.border = copy(origem.border)
+    destino.alignment = copy(origem.alignment)
+    destino.number_format = origem.number_format
+    destino.protection = copy(origem.protection)
+
+
+def __copiar_propriedades_worksheet(ws_modelo: type[Worksheet], ws: Any) -> None:
+    """
+    Copia para um worksheet write-only as configurações da aba modelo que não pertencem às células: visualização,
+    formatação condicional, validações, filtro, impressão e dimensões das linhas e colunas.
+    """
+    ws.sheet_properties = copy(ws_modelo.sheet_properties)
+    ws.sheet_format = copy(ws_modelo.sheet_format)
+    ws.views = copy(ws_modelo.views)
+    ws.conditional_formatting = copy(ws_modelo.conditional_formatting)
+    ws.data_validations = copy(ws_modelo.data_validations)
+    ws.auto_filter = copy(ws_modelo.auto_filter)
+    ws.print_options = copy(ws_modelo.print_options)
+    ws.page_margins = copy(ws_modelo.page_margins)
+    ws.page_setup = copy(ws_modelo.page_setup)
+    for intervalo in ws_modelo.merged_cells.ranges:
+        ws.merged_cells.add(copy(intervalo))
+
+    for letra, dimensao in ws_modelo.column_dimensions.items():
+        dimensao_destino = ws.column_dimensions[letra]
+        dimensao_destino.width = dimensao.width
+        dimensao_destino.min, dimensao_destino.max = dimensao.min, dimensao.max
+        dimensao_destino.hidden = dimensao.hidden
+        if dimensao.has_style:
+            __copiar_estilo(dimensao, dimensao_destino)
+
+    for num_linha, dimensao in ws_modelo.row_dimensions.items():
+        if dimensao.height is not None or dimensao.hidden:
+            ws.row_dimensions[num_linha].height = dimensao.height
+            ws.row_dimensions[num_linha].hidden = dimensao.hidden
+
+
+def buscar_todos_indices_row_por_similaridade(word: str, row: type[tuple]) -> Optional[tuple]:
+
+    return __buscar_todos_indices_por_similaridade(
+        word, [cell.value if cell.data_type == "s" else None for cell in row]
     )
 
-    # Iterate through rows and copy cell values
-    i = 0
-    for row_index in range(row_init_origem, row_fim_origem):
-        source_cell_value = ws_source.cell(row=row_index, column=j_source).value
-        ws_destino.cell(row=row_init_destino + i, column=j_destino).value = (
-            source_cell_value
+
+def __buscar_todos_indices_por_similaridade(word: str, valores_row: list) -> tuple:
+
+    candidatos = [valor if isinstance(valor, str) else None for valor in valores_row]
+    scores = cabecalhos.pontuar(word, candidatos, "partial_ratio")
+
+    indices = []
+    for j in np.flatnonzero(scores > 90):
+        logger.debug(
+            "As palavras %s e %s possuem o score %d. O indice da coluna é %d",
+            word,
+            candidatos[j],
+            scores[j],
+            j,
         )
-        i += 1
-    #   logger.info("Celula de valor %s na origem copiada para o destino!",source_cell_value)
+        indices.append(int(j))
+
+    return tuple(indices)
+
+
+def buscar_indice_row_por_similaridade(word: str, row: type[tuple]) -> Optional[int]:
+
+    indices = buscar_todos_indices_row_por_similaridade(word, row)
+    if indices:
+        return indices[0]
 
 
 def index_first_empty_row(ws: type[Worksheet]) -> int:
-    for row_index in range(1, ws.max_row + 2):  # Iterate up to one row beyond max_row
-        is_empty = True
-        for col_index in range(1, ws.max_column + 1):
-            cell_value = ws.cell(row=row_index, column=col_index).value
-            if cell_value is not None:
-                is_empty = False
-                break  # Found a non-empty cell in this row, so it's not empty
-        if is_empty:
-            return row_index
-
-
-def autofit(worksheet: type[Worksheet], scale=1.0) -> None:
-    for col in worksheet.columns:
-        max_length = 0
-        column = col[0].column_letter  # Get the column name
-        for cell in col:
-            try:  # Necessary to avoid error on empty cells
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length) * scale
-        worksheet.column_dimensions[column].width = adjusted_width
+    """
+    Primeira linha sem nenhum valor preenchido, consultando apenas as células existentes no worksheet, sem
+    percorrer a grade de linhas e colunas nem criar células vazias.
+    """
+    linhas_preenchidas = {row for (row, _), cell in ws._cells.items() if cell.value is not None}
+
+    row_index = 1
+    while row_index in linhas_preenchidas:
+        row_index += 1
+
+    return row_index
+
+
+class LargurasColunas:
+    """
+    Acumula a maior largura de exibição de cada coluna à medida que as linhas são escritas, evitando percorrer a
+    planilha depois de pronta. No modo de amostragem (num_linhas_amostra), apenas as primeiras linhas são
+    medidas, além das linhas informadas com amostra=False, como as de cabeçalho.
+    """
+
+    def __init__(self, num_linhas_amostra: Optional[int] = None):
+        self.num_linhas_amostra = num_linhas_amostra or None
+        self.num_linhas = 0
+        self.__larguras = []
+
+    @property
+    def amostra_completa(self) -> bool:
+        return self.num_linhas_amostra is not None and self.num_linhas >= self.num_linhas_amostra
 
+    def atualizar(self, valores: Iterable, amostra: bool = True) -> None:
+        if amostra:
+            if self.amostra_completa:
+                return
+            self.num_linhas += 1
 
+        for j, valor in enumerate(valores):
+            self.atualizar_celula(j, valor)
+
+    def atualizar_celula(self, j: int, valor: Any) -> None:
+        """
+        Mede uma única célula da coluna j (a partir de 0), sem contá-la como uma linha da amostra.
+        """
+        larguras = self.__larguras
+        if j >= len(larguras):
+            larguras.extend([0] * (j + 1 - len(larguras)))
+        if valor is not None:
+            largura = len(str(valor))
+            if largura > larguras[j]:
+                larguras[j] = largura
+
+    def larguras(self, scale: float = 1.0) -> dict[int, float]:
+        """
+        Larguras por número de coluna (a partir de 1), apenas das colunas com algum valor.
+        """
+        return {j: largura * scale for j, largura in enumerate(self.__larguras, start=1) if largura}
+
+    def aplicar(self, ws: Any, scale: float = 1.0) -> None:
+        for j, largura in self.larguras(scale).items():
+            ws.column_dimensions[get_column_letter(j)].width = largura
+
+
+@instrumentacao.medir
 def mesclar(
-    planilhas_excel: list[str], dest_filename: str = "output.xlsx"
+    planilhas_excel: list[str], dest_filename: str = "output.xlsx", checkpoint: bool = False
 ) -> Optional[str]:
     """
-    A partir de uma lista de caminhos de arquivos em Excel, mescla todas elas retornando o caminho do arquivo
-    gerado.
+    A partir de uma lista de caminhos de arquivos em Excel (ou em formato colunar), mescla todas elas retornando
+    o caminho do arquivo gerado. Cada planilha é lida uma única vez e a mesclagem acumulada é mantida em memória, sendo gravada
+    somente ao final. Com checkpoint=True, cada mesclagem intermediária também é gravada para depuração.
     """
     logger.info(
         f"Mesclando as planilhas {planilhas_excel} através do Pandas (total de planilhas: {len(planilhas_excel)})..."
@@ -242,20 +969,31 @@ def mesclar(
     elif len(planilhas_excel) == 1:
         return planilhas_excel[0]
     else:
-        planilha_merged = planilhas_excel[0]
+        carregadas = carregar_planilhas(planilhas_excel)
+
+        def ler_planilha(k: int, skiprows: int, index_col: Optional[int] = None) -> pd.DataFrame:
+            # O DataFrame carregado é usado se o cabeçalho casado estiver na linha prevista; senão, a planilha é
+            # lida novamente a partir da linha casada.
+            skiprows_carregada, df = carregadas[k]
+            if skiprows_carregada != skiprows:
+                df = ler_excel(planilhas_excel[k], skiprows=skiprows)
+            return df.set_index(df.columns[index_col]) if index_col is not None else df
+
+        planilha1 = planilhas_excel[0]
+        celulas1 = buscar_celulas_cabecalho(planilha1)
+        merged = None
         for i in range(1, len(planilhas_excel)):
-            planilha1 = planilha_merged
             planilha2 = planilhas_excel[i]
-            tuplas = buscar_indices_merging_por_similaridade(planilha1, planilha2)
+            tuplas = casar_celulas_cabecalho(celulas1, buscar_celulas_cabecalho(planilha2))
             if tuplas:
                 tupla1 = tuplas[0]
-                df1 = pd.read_excel(
-                    planilha1, skiprows=tupla1[0] - 1, index_col=tupla1[1] - 1
-                )
+                if merged is None:
+                    df1 = ler_planilha(0, tupla1[0] - 1, tupla1[1] - 1)
+                else:
+                    df1 = __como_planilha(merged)
+                    df1 = df1.set_index(df1.columns[tupla1[1] - 1])
                 tupla2 = tuplas[1]
-                df2 = pd.read_excel(
-                    planilha2, skiprows=tupla2[0] - 1, index_col=tupla2[1] - 1
-                )
+                df2 = ler_planilha(i, tupla2[0] - 1, tupla2[1] - 1)
                 logger.debug(
                     "Os nomes dos índices dos dataframes criados na primeira planilha %s é %s e na segunda planilha %s é %s",
                     planilha1,
@@ -268,55 +1006,215 @@ def mesclar(
                 else:
                     merged = df1.join(df2)
             else:
-                df1 = pd.read_excel(planilha1)
-                df2 = pd.read_excel(planilha2)
+                if merged is None:
+                    df1 = ler_planilha(0, 0)
+                else:
+                    df1 = __como_planilha(merged)
+                df2 = ler_planilha(i, 0)
                 merged = pd.concat([df1, df2], axis=0)
-            planilha_merged = dest_filename
 
-            merged.to_excel(planilha_merged)
+            planilha1 = dest_filename
+            celulas1 = __celulas_cabecalho_dataframe(merged)
+
+            if checkpoint and i < len(planilhas_excel) - 1:
+                raiz, extensao = os.path.splitext(dest_filename)
+                gravar_planilha(merged, f"{raiz}.{i}{extensao}")
+
+        instrumentacao.registrar_linhas(len(merged))
+        return gravar_planilha(merged, dest_filename)
+
+
+@instrumentacao.medir
+def carregar_planilhas(
+    planilhas_excel: list[str],
+    max_workers: Optional[int] = None,
+    max_linhas_cabecalho: int = MAX_LINHAS_CABECALHO,
+) -> list[Tuple[int, pd.DataFrame]]:
+    """
+    Lê as planilhas para a mesclagem, retornando, na mesma ordem das planilhas, pares (skiprows, DataFrame). Cada
+    planilha é lida a partir da linha de cabeçalho que mesclar usará, obtida com o mesmo casamento de cabeçalhos
+    (casar_celulas_cabecalho). As planilhas em Excel são lidas em paralelo, no pool de processos de leitura, se
+    somarem ao menos MIN_MB_LEITURA_PARALELA.
+    """
+    if max_workers is None:
+        max_workers = MAX_PROCESSOS_LEITURA
+
+    linhas_cabecalho = __prever_linhas_cabecalho(
+        [buscar_celulas_cabecalho(path, max_linhas_cabecalho) for path in planilhas_excel]
+    )
+    skiprows = [linha_cabecalho - 1 for linha_cabecalho in linhas_cabecalho]
+    dfs: list[Optional[pd.DataFrame]] = [
+        __ler_planilha_colunar(path, skiprows=k) if e_planilha_colunar(path) else None
+        for path, k in zip(planilhas_excel, skiprows)
+    ]
+    leituras = [(n, path, k) for n, (path, k, df) in enumerate(zip(planilhas_excel, skiprows, dfs)) if df is None]
+
+    tamanho = sum(os.path.getsize(path) for _, path, _ in leituras)
+    if max_workers <= 1 or len(leituras) <= 1 or tamanho < MIN_MB_LEITURA_PARALELA * 1024 * 1024:
+        for n, path, k in leituras:
+            dfs[n] = pd.read_excel(path, skiprows=k)
+    else:
+        logger.info("Carregando %d planilhas em paralelo com até %d processos...", len(leituras), max_workers)
+        pool = __obter_pool_leitura(max_workers)
+        futures = [pool.submit(pd.read_excel, path, skiprows=k) for _, path, k in leituras]
+        for (n, path, _), future in zip(leituras, futures):
+            try:
+                dfs[n] = future.result()
+            except Exception as e:
+                for pendente in futures:
+                    pendente.cancel()
+                if isinstance(e, BrokenExecutor):
+                    __descartar_pool_leitura(max_workers)
+                raise RuntimeError(f"Falha ao carregar a planilha {path}: {e}") from e
+
+    instrumentacao.registrar_linhas(sum(len(df) for df in dfs))
+    return list(zip(skiprows, dfs))
+
+
+def __prever_linhas_cabecalho(celulas: list[list[Tuple[int, int, str]]]) -> list[int]:
+    """
+    Linha do cabeçalho de cada planilha na mesclagem, casando as células de cabeçalho na mesma ordem de mesclar.
+    A primeira mesclagem é prevista exatamente; nas seguintes, o cabeçalho acumulado é aproximado pela chave
+    seguida dos cabeçalhos já mesclados. Se mesclar casar outra linha, a planilha é lida novamente.
+    """
+    linhas = [1] * len(celulas)
+    if not celulas:
+        return linhas
+
+    celulas1 = celulas[0]
+    for k in range(1, len(celulas)):
+        celulas2 = celulas[k]
+        tuplas = casar_celulas_cabecalho(celulas1, celulas2)
+        if tuplas:
+            (i1, j1), (i2, j2) = tuplas
+            if k == 1:
+                linhas[0] = i1
+            linhas[k] = i2
+            nomes = [valor for i, j, valor in celulas1 if (i, j) == (i1, j1)]
+            nomes += [valor for i, j, valor in celulas1 if i == i1 and j != j1]
+            nomes += [valor for i, j, valor in celulas2 if i == i2 and j != j2]
+        else:
+            nomes = [valor for i, _, valor in celulas1 + celulas2 if i == 1]
+        celulas1 = [(1, j + 1, nome) for j, nome in enumerate(nomes)]
 
-        return dest_filename
+    return linhas
+
+
+# Pools de processos da leitura paralela, por quantidade de processos, criados na primeira leitura e reaproveitados
+# pelas seguintes. Os processos são iniciados com spawn: um fork feito com outras threads em execução (agente
+# assíncrono) pode herdar locks travados por elas.
+__pools_leitura: dict[int, ProcessPoolExecutor] = {}
+__lock_pools_leitura = threading.Lock()
+
+
+def __obter_pool_leitura(max_workers: int) -> ProcessPoolExecutor:
+    with __lock_pools_leitura:
+        if max_workers not in __pools_leitura:
+            __pools_leitura[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return __pools_leitura[max_workers]
+
+
+def __descartar_pool_leitura(max_workers: int) -> None:
+    # Um pool com um processo encerrado abruptamente não aceita mais tarefas; a próxima leitura cria outro.
+    with __lock_pools_leitura:
+        pool = __pools_leitura.pop(max_workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def __como_planilha(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retorna o DataFrame com o layout que ele teria se fosse gravado com to_excel e lido novamente: o índice
+    passa a ser a primeira coluna.
+    """
+    return df.reset_index(names=df.index.name if df.index.name is not None else "Unnamed: 0")
+
+
+def __celulas_cabecalho_dataframe(df: pd.DataFrame) -> list[Tuple[int, int, str]]:
+    """
+    Células de texto do cabeçalho que o DataFrame teria se fosse gravado com to_excel.
+    """
+    nomes = [df.index.name] + list(df.columns)
+    return [(1, j + 1, nome) for j, nome in enumerate(nomes) if isinstance(nome, str)]
 
 
 def buscar_indices_merging_por_similaridade(
-    arq_excel1: str, arq_excel2: str
+    arq_excel1: str, arq_excel2: str, max_linhas_cabecalho: int = MAX_LINHAS_CABECALHO
 ) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
     """
     Busca duas tuplas de indices (i,j) para as duas planilhas passadas referentes à similaridade de nome de coluna.
+    Somente as primeiras max_linhas_cabecalho linhas de cada planilha são consideradas na busca pelo cabeçalho.
     """
-    wb_obj1 = openpyxl.load_workbook(arq_excel1)
-    wb_obj2 = openpyxl.load_workbook(arq_excel2)
-
-    sheet1 = wb_obj1.active
-    sheet2 = wb_obj2.active
-
-    for i1 in range(1, sheet1.max_row + 1):
-        for j1 in range(1, sheet1.max_column + 1):
-            cell1 = sheet1.cell(row=i1, column=j1)
-            for i2 in range(1, sheet2.max_row + 1):
-                for j2 in range(1, sheet2.max_column + 1):
-                    cell2 = sheet2.cell(row=i2, column=j2)
-                    if cell1.data_type == "s" and cell2.data_type == "s":
-                        word1 = str(cell1.value).strip().lower()
-                        word2 = str(cell2.value).strip().lower()
-                        score = fuzz.ratio(word1, word2)
-                        if score > 80:
-                            logger.debug(
-                                "As palavras %s e %s possuem o score %d (arquivos %s e %s)!",
-                                word1,
-                                word2,
-                                score,
-                                arq_excel1,
-                                arq_excel2,
-                            )
-                            logger.debug(
-                                "Achei por similaridade as coordenadas (%d,%d) e (%d,%d)!",
-                                i1,
-                                j1,
-                                i2,
-                                j2,
-                            )
-                            return ((i1, j1), (i2, j2))
+    par = casar_celulas_cabecalho(
+        buscar_celulas_cabecalho(arq_excel1, max_linhas_cabecalho),
+        buscar_celulas_cabecalho(arq_excel2, max_linhas_cabecalho),
+    )
+    if par:
+        logger.debug(
+            "Achei por similaridade as coordenadas %s e %s (arquivos %s e %s)!",
+            par[0],
+            par[1],
+            arq_excel1,
+            arq_excel2,
+        )
+    return par
+
+
+@instrumentacao.medir
+def buscar_celulas_cabecalho(
+    arq_excel: str, max_linhas_cabecalho: int = MAX_LINHAS_CABECALHO
+) -> list[Tuple[int, int, str]]:
+    """
+    Lê em modo somente leitura apenas as primeiras linhas da planilha e retorna as células de texto
+    candidatas a cabeçalho como tuplas (i, j, valor).
+    """
+    if e_planilha_colunar(arq_excel):
+        return __celulas_cabecalho_dataframe(__ler_dataframe_colunar(arq_excel))
+
+    return list(
+        __cache_planilhas.obter(
+            "cabecalho",
+            arq_excel,
+            lambda: __ler_celulas_cabecalho(arq_excel, max_linhas_cabecalho),
+            __estimar_bytes_cabecalho,
+            max_linhas_cabecalho=max_linhas_cabecalho,
+        )
+    )
+
+
+def __ler_celulas_cabecalho(arq_excel: str, max_linhas_cabecalho: int) -> list[Tuple[int, int, str]]:
+    wb = openpyxl.load_workbook(arq_excel, read_only=True)
+    try:
+        return [
+            (cell.row, cell.column, cell.value)
+            for row in wb.active.iter_rows(max_row=max_linhas_cabecalho)
+            for cell in row
+            if cell.data_type == "s"
+        ]
+    finally:
+        wb.close()
+
+
+def __estimar_bytes_cabecalho(celulas: list) -> int:
+    return BYTES_POR_CELULA * len(celulas)
+
+
+def casar_celulas_cabecalho(
+    celulas1: list[Tuple[int, int, str]], celulas2: list[Tuple[int, int, str]]
+) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Retorna as coordenadas ((i1,j1),(i2,j2)) do primeiro par de células de cabeçalho similares, na ordem
+    das células da primeira planilha.
+    """
+    par = cabecalhos.primeiro_par_acima(
+        [valor for _, _, valor in celulas1], [valor for _, _, valor in celulas2], 80
+    )
+    if par:
+        i1, j1, _ = celulas1[par[0]]
+        i2, j2, _ = celulas2[par[1]]
+        return ((i1, j1), (i2, j2))
 
 
 if __name__ == "__main__":
@@ -1,10 +1,19 @@
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 import os
+import shutil
 import sys
-from typing import List, Optional
-
-import pandas as pd
-from langchain.callbacks.manager import CallbackManagerForToolRun
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterable, List, Optional
+
+from langchain_core.callbacks.manager import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
 from langchain_core.tools.base import BaseTool
 from pydantic import BaseModel
 
@@ -13,15 +22,82 @@ load_dotenv()
 
 from schemas import *
 
-import openpyxl
-from openpyxl.worksheet.worksheet import Worksheet
-
-import excel
+# As rotinas de planilha (pandas, openpyxl e rapidfuzz) são importadas somente quando uma ferramenta é executada,
+# para que a inicialização do agente e do pipeline não pague por elas.
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# Quantidade máxima de ferramentas executadas ao mesmo tempo pelo agente assíncrono.
+MAX_FERRAMENTAS_CONCORRENTES = int(os.environ.get("MAX_FERRAMENTAS_CONCORRENTES", 4))
+
+EXECUTOR_FERRAMENTAS = ThreadPoolExecutor(
+    max_workers=MAX_FERRAMENTAS_CONCORRENTES, thread_name_prefix="ferramenta"
+)
+
+# Locks dos arquivos usados pelas ferramentas em execução, por event loop (os locks do asyncio pertencem a um loop).
+locks_arquivos: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Lock]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def executar_em_thread(funcao: Callable, *args, **kwargs) -> Any:
+    """
+    Executa a função bloqueante (leitura e escrita de planilhas) em uma thread do executor das ferramentas,
+    liberando o event loop para as chamadas da LLM e para as demais ferramentas.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        EXECUTOR_FERRAMENTAS, functools.partial(funcao, *args, **kwargs)
+    )
+
+
+@asynccontextmanager
+async def bloquear_arquivos(paths: Iterable[str]) -> AsyncIterator[None]:
+    """
+    Bloqueia os arquivos durante o bloco, de modo que as ferramentas que usam um mesmo arquivo (por exemplo, a
+    remoção de colaboradores, que altera a planilha, e a leitura dos estados da mesma planilha) sejam executadas
+    uma de cada vez, na ordem em que foram chamadas, enquanto as que usam arquivos diferentes são concorrentes.
+    Os locks são adquiridos em ordem alfabética dos caminhos para evitar deadlocks.
+    """
+    locks = locks_arquivos.setdefault(asyncio.get_running_loop(), {})
+    adquiridos = []
+    try:
+        for path in sorted({os.path.abspath(path) for path in paths}):
+            lock = locks.setdefault(path, asyncio.Lock())
+            await lock.acquire()
+            adquiridos.append(lock)
+        yield
+    finally:
+        for lock in reversed(adquiridos):
+            lock.release()
+
+
+class FerramentaPlanilha(BaseTool):
+    """
+    Ferramenta de planilhas com execução assíncrona: o _run bloqueante é executado no executor das ferramentas,
+    com os arquivos de entrada bloqueados. Os arquivos de entrada são os caminhos existentes nos argumentos ou,
+    se a ferramenta definir o método arquivos_entrada, os que ele retornar.
+    """
+
+    async def _arun(
+        self,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+        **kwargs,
+    ) -> Any:
+
+        if hasattr(self, "arquivos_entrada"):
+            arquivos_entrada = self.arquivos_entrada(**kwargs)
+        else:
+            arquivos_entrada = caminhos_arquivos(kwargs)
+
+        async with bloquear_arquivos(arquivos_entrada):
+            return await executar_em_thread(
+                self._run, **kwargs, run_manager=run_manager.get_sync() if run_manager else None
+            )
+
 
-class UnzipFileTool(BaseTool):
+class UnzipFileTool(FerramentaPlanilha):
     name: str = "Unzip"
     description: str = (
         """
@@ -32,15 +108,21 @@ class UnzipFileTool(BaseTool):
     args_schema: type[BaseModel] = UnzipFileInput
     return_direct: bool = False
 
+    def arquivos_entrada(self, nome_arquivo: str, **kwargs) -> List[str]:
+        return [os.path.join(os.environ['DATA_FOLDER'], nome_arquivo)]
+
     def _run(
         self,
         nome_arquivo: str,
         diretorio: str,
         run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> List[str]:
-        """Utiliza a ferramenta de forma síncrona."""
+        """
+        Utiliza a ferramenta de forma síncrona. A extração é incremental: os arquivos cujo CRC e tamanho
+        coincidem com o manifesto da extração anterior e que não foram alterados desde então não são extraídos
+        novamente. Somente os caminhos dos arquivos contidos no arquivo compactado são retornados.
+        """
         import zipfile
-        from pathlib import Path
 
         diretorio_destino = os.environ['OUTPUT_FOLDER']
 
@@ -49,24 +131,62 @@ class UnzipFileTool(BaseTool):
         )
 
         full_path = os.path.join(os.environ['DATA_FOLDER'], nome_arquivo)
+        path_manifesto = os.path.join(
+            diretorio_destino, f".{os.path.basename(nome_arquivo)}.manifesto.json"
+        )
+        manifesto = self.__ler_manifesto(path_manifesto)
+        novo_manifesto = {}
 
+        paths_arquivos_descompactados = []
         with zipfile.ZipFile(full_path, "r") as zip_ref:
-            zip_ref.extractall(diretorio_destino)
-
-        directory_destino_path = Path(diretorio_destino)
+            for membro in zip_ref.infolist():
+                if membro.is_dir():
+                    continue
+
+                path_destino = os.path.abspath(os.path.join(diretorio_destino, membro.filename))
+                if os.path.commonpath([path_destino, os.path.abspath(diretorio_destino)]) != os.path.abspath(diretorio_destino):
+                    logger.warning("Ignorando o arquivo %s fora do diretório destino.", membro.filename)
+                    continue
+
+                entrada = manifesto.get(membro.filename)
+                if entrada and entrada[:2] == [membro.CRC, membro.file_size] and entrada[2:] == self.__assinatura(path_destino):
+                    logger.debug("O arquivo %s não foi alterado e não será extraído.", membro.filename)
+                else:
+                    logger.debug("Extraindo o arquivo %s...", membro.filename)
+                    os.makedirs(os.path.dirname(path_destino), exist_ok=True)
+                    with zip_ref.open(membro) as origem, open(path_destino, "wb") as destino:
+                        shutil.copyfileobj(origem, destino, 1024 * 1024)
+
+                novo_manifesto[membro.filename] = [membro.CRC, membro.file_size] + self.__assinatura(path_destino)
+                paths_arquivos_descompactados.append(
+                    os.path.join(diretorio_destino, membro.filename)
+                )
 
-        paths_arquivos_descompactados = [
-            os.path.join(diretorio_destino, entry.name)
-            for entry in directory_destino_path.iterdir()
-            if entry.is_file()
-        ]
+        with open(path_manifesto + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(novo_manifesto, f)
+        os.replace(path_manifesto + ".tmp", path_manifesto)
 
         logging.info(f"Os arquivos descompactados são: {paths_arquivos_descompactados}")
 
         return paths_arquivos_descompactados
 
+    def __ler_manifesto(self, path_manifesto: str) -> dict:
+        try:
+            with open(path_manifesto, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __assinatura(self, path: str) -> Optional[list]:
+        # Um arquivo do manifesto que foi removido ou não pode ser lido é considerado alterado e extraído novamente.
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
 
-class ReunirDadosTool(BaseTool):
+class ReunirDadosTool(FerramentaPlanilha):
 
     name: str = "ReunirDados"
     description: str = (
@@ -81,6 +201,8 @@ class ReunirDadosTool(BaseTool):
         run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> str:
 
+        import excel
+
         if isinstance(paths, list):
             paths_planilhas_excel = paths
         else:
@@ -92,45 +214,71 @@ class ReunirDadosTool(BaseTool):
 
         return excel.mesclar(
             paths_planilhas_excel,
-            PlanilhaTemporaria().obter_caminho_arquivo_temporario("merged.xlsx"),
+            PlanilhaTemporaria().obter_caminho_planilha_temporaria("merged"),
         )
 
 
-class EstadosDosSindicatosTool(BaseTool):
+class EstadosDosSindicatosTool(FerramentaPlanilha):
     name: str = "EstadosDosSindicatos"
     description: str = (
-        "A partir da planilha contendo os nomes dos sindicatos, obter o mapeamento dos estados correspondentes. Retorna o caminho da planilha contendo para cada sindicato, o estado correspondente"
+        "A partir da planilha com os dados dos colaboradores, obtém o estado correspondente ao sindicato de cada colaborador e o reúne aos dados. Retorna o caminho da planilha com os dados dos colaboradores e os estados."
     )
     return_direct: bool = False
-    args_schema: type[BaseTool] = None
+    args_schema: type[BaseModel] = EstadosDosSindicatosInput
 
     def _run(
         self,
+        path_planilha_dados_colaboradores: str,
         run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> str:
 
-        sindicato_estados = {
-            "SINDPD RJ - SINDICATO PROFISSIONAIS DE PROC DADOS DO RIO DE JANEIRO": "Rio de Janeiro",
-            "SINDPPD RS - SINDICATO DOS TRAB. EM PROC. DE DADOS RIO GRANDE DO SUL": "Rio Grande do Sul",
-            "SINDPD SP - SIND.TRAB.EM PROC DADOS E EMPR.EMPRESAS PROC DADOS ESTADO DE SP": "São Paulo",
-            "SINDPD SP - SIND.TRAB.EM PROC DADOS E EMPR.EMPRESAS PROC DADOS ESTADO DE SP.": "São Paulo",
-            "SITEPD PR - SIND DOS TRAB EM EMPR PRIVADAS DE PROC DE DADOS DE CURITIBA E REGIAO METROPOLITANA": "Paraná",
-            "SINDPD RJ - SINDICATO PROFISSIONAIS DE PROC DADOS DO RIO DE JANEIRO": "Rio de Janeiro",
-        }
+        import excel
+        import referencias
 
-        column_names = ["Sindicato", "Estado"]
+        logger.info(
+            f"Obtendo os estados dos sindicatos dos colaboradores da planilha {path_planilha_dados_colaboradores} ..."
+        )
 
-        df_sindicato_vs_estado = pd.DataFrame(
-            sindicato_estados.items(), columns=column_names
+        # O mapeamento sindicato -> estado é um índice em memória, sem planilha intermediária a ser mesclada.
+        df = excel.ler_excel(path_planilha_dados_colaboradores, index_col=0)
+        df = referencias.obter_referencias().adicionar_estados(df)
+
+        return PlanilhaTemporaria().exportar_dados_planilha_temporaria(
+            df, "colaboradores_x_estados.xlsx"
         )
-        df_sindicato_vs_estado = df_sindicato_vs_estado.set_index("Sindicato")
+
+
+class ValoresDosEstadosTool(FerramentaPlanilha):
+    name: str = "ValoresDosEstados"
+    description: str = (
+        "Reúne aos dados dos colaboradores o valor diário do estado de cada colaborador, a partir da planilha de valores por estado. Retorna o caminho da planilha com os dados dos colaboradores e os valores."
+    )
+    return_direct: bool = False
+    args_schema: type[BaseModel] = ValoresDosEstadosInput
+
+    def _run(
+        self,
+        path_planilha_dados_colaboradores: str,
+        planilha_valores: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+
+        import excel
+        import referencias
+
+        logger.info(
+            f"Reunindo os valores por estado da planilha {planilha_valores} aos colaboradores da planilha {path_planilha_dados_colaboradores} ..."
+        )
+
+        df = excel.ler_excel(path_planilha_dados_colaboradores, index_col=0)
+        df = referencias.obter_referencias(planilha_valores).adicionar_valores(df)
 
         return PlanilhaTemporaria().exportar_dados_planilha_temporaria(
-            df_sindicato_vs_estado, "sindicatos_x_estados.xlsx"
+            df, "colaboradores_x_valores.xlsx"
         )
 
 
-class RemoverColaboradoresNaPlanilhaTool(BaseTool):
+class RemoverColaboradoresNaPlanilhaTool(FerramentaPlanilha):
     name: str = "RemoverDadosNaPlanilha"
     description: str = (
         "Remove dados de colaboradores em função dos cargos enumerados."
@@ -144,7 +292,9 @@ class RemoverColaboradoresNaPlanilhaTool(BaseTool):
             cargos: str,
             run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> str:
-        
+
+        import excel
+
         cargos_list = cargos.split(',')
         logger.info("Removendo colaboradores da planilha %s em relação aos cargos %s...",path_planilha_dados_colaboradores,cargos_list)
 
@@ -152,13 +302,15 @@ class RemoverColaboradoresNaPlanilhaTool(BaseTool):
         excel.remover_registros_planilha_por_valores_especificos_coluna(path_planilha_dados_colaboradores,'Situação',cargos_list)
 
 
-class EscreverDadosNaPlanilhaTool(BaseTool):
+class EscreverDadosNaPlanilhaTool(FerramentaPlanilha):
     name: str = "EscreverDadosNaPlanilha"
     description: str = (
         "Escreve ou copia os dados em uma planilha destino, completando a mesma."
     )
     return_direct: bool = True
     args_schema: type[BaseModel] = EscreverDadosNaPlanilhaInput
+    # Além dos valores calculados, escreve nas células as fórmulas equivalentes do Excel.
+    escrever_formulas: bool = os.environ.get("FORMULAS_PLANILHA_FINAL", "0") == "1"
 
     def _run(
         self,
@@ -170,90 +322,245 @@ class EscreverDadosNaPlanilhaTool(BaseTool):
         run_manager: Optional[CallbackManagerForToolRun] = None,
     ) -> str:
 
+        import calculo
+        import excel
+
         logger.info(
             f"Exportando os dados oriundos da planilha {path_origem} para a planilha final em {path_destino} e competencia {competencia} com os percentuais de {percentual_custo_empresa}% para empresa e {percentual_custo_empregado}% para o empregado..."
         )
 
-        excel.preencher_planilha(
-            path_origem, path_destino, 1, 2, max_col_planilha_destino=6
-        )
+        if percentual_custo_empresa > 1:
+            percentual_custo_empresa /= 100.
 
-        wb_destino = openpyxl.load_workbook(path_destino)
+        if percentual_custo_empregado > 1:
+            percentual_custo_empregado /= 100.
 
-        ws_destino = wb_destino.active
+        # Os valores de cada colaborador são calculados em lote; opcionalmente as células recebem as fórmulas.
+        totais = defaultdict(Decimal)
+
+        def calcular_vr(df: "pd.DataFrame") -> "pd.DataFrame":
+            df_calculado = calculo.calcular_vr(
+                df,
+                percentual_custo_empresa,
+                percentual_custo_empregado,
+                coluna_dias="Dias",
+                coluna_valor="VALOR DIÁRIO VR",
+            )
+            for coluna, total in calculo.totalizar(df_calculado).items():
+                totais[coluna] += total
+            return df_calculado
+
+        formulas_linhas = None
+        if self.escrever_formulas:
+            formulas_linhas = {
+                "G": "=$E{linha}*$F{linha}",
+                "H": f"=$G{{linha}}*{percentual_custo_empresa}",
+                "I": f"=$G{{linha}}*{percentual_custo_empregado}",
+            }
+
+        # A planilha final é gerada em uma única passagem: os dados são copiados a partir da primeira linha vazia,
+        # com a competência preenchida, os registros incompletos descartados, os valores calculados e o total.
+        excel.escrever_planilha_final(
+            path_origem,
+            path_destino,
+            indice_planilha_origem=1,
+            indice_planilha_destino=2,
+            max_col_planilha_destino=6,
+            valores_colunas={"Competencia": competencia.replace(".", "/")},
+            colunas_obrigatorias=["Matricula", "Sindicato"],
+            formulas_linhas=formulas_linhas,
+            formulas_celulas={"G1": "=SUM($G2:$G{ultima_linha})"},
+            calcular_colunas=calcular_vr,
+        )
 
-        wb_origem = openpyxl.load_workbook(path_origem)
-        ws_origem = wb_origem.active
+        logger.info(
+            "Totais calculados: %s.", {coluna: f"{total:.2f}" for coluna, total in totais.items()}
+        )
 
-        # Preenche a compentência na coluna Competencia:
+        logger.info(f"Planilha {path_destino} preenchida.")
 
-        num_primeira_linha_nao_preenchida = 4
+        return path_destino
 
-        i = num_primeira_linha_nao_preenchida
-        j = excel.buscar_indice_row_por_similaridade("Competencia", ws_destino[2])
-        for row in ws_destino.iter_rows(min_row=num_primeira_linha_nao_preenchida):
-            if row[0].value:
-                ws_destino.cell(
-                    row=i, column=j + 1, value=competencia.replace(".", "/")
-                )
-            i += 1
 
-        assert j != None
+class CacheResultadosFerramentas:
+    """
+    Cache dos resultados das ferramentas, identificados pelo nome da ferramenta, pelos argumentos normalizados e
+    pelo conteúdo dos arquivos de entrada. Um resultado só é reaproveitado se os arquivos que ele referencia
+    continuarem inalterados desde a execução que o produziu.
+    """
 
-        # Vamos definir a formula total:
-        ws_destino["G1"].value = f"=SUM($G2:$G{ws_destino.max_row})"
+    def __init__(self):
+        self.__entradas = {}
+        self.__hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def chave(self, nome_ferramenta: str, argumentos: dict, arquivos_entrada: List[str]) -> str:
+        # Os argumentos são normalizados pela serialização em JSON com as chaves ordenadas.
+        return json.dumps(
+            [
+                nome_ferramenta,
+                argumentos,
+                {os.path.abspath(path): self.__hash_arquivo(path) for path in arquivos_entrada},
+            ],
+            sort_keys=True,
+            default=str,
+        )
 
-        if percentual_custo_empresa > 1:
-            percentual_custo_empresa /= 100.
+    def obter(self, chave: str) -> tuple[bool, Any]:
+        if chave in self.__entradas:
+            resultado, assinaturas = self.__entradas[chave]
+            if all(self.__assinatura(path) == assinatura for path, assinatura in assinaturas.items()):
+                self.hits += 1
+                return True, resultado
+            del self.__entradas[chave]
+        self.misses += 1
+        return False, None
+
+    def guardar(self, chave: str, resultado: Any) -> None:
+        self.__entradas[chave] = (
+            resultado,
+            {path: self.__assinatura(path) for path in caminhos_arquivos(resultado)},
+        )
 
-        if percentual_custo_empregado > 1:
-            percentual_custo_empregado /= 100.
+    def __hash_arquivo(self, path: str) -> str:
+        assinatura = self.__assinatura(path)
+        if assinatura is None:
+            return None
+        chave = (os.path.abspath(path), assinatura)
+        if chave not in self.__hashes:
+            sha256 = hashlib.sha256()
+            with open(path, "rb") as f:
+                for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(bloco)
+            self.__hashes[chave] = sha256.hexdigest()
+        return self.__hashes[chave]
+
+    def __assinatura(self, path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+class FerramentaComCache(BaseTool):
+    """
+    Envolve uma ferramenta reaproveitando o resultado de chamadas repetidas com os mesmos argumentos e os mesmos
+    arquivos de entrada, comuns quando o agente ReAct repete uma ação. Os arquivos de entrada são os caminhos
+    existentes nos argumentos ou, se a ferramenta definir o método arquivos_entrada, os que ele retornar.
+    """
+
+    ferramenta: BaseTool
+    cache: CacheResultadosFerramentas
+
+    def __init__(self, ferramenta: BaseTool, cache: Optional[CacheResultadosFerramentas] = None, **kwargs):
+        super().__init__(
+            name=ferramenta.name,
+            description=ferramenta.description,
+            args_schema=ferramenta.args_schema or ferramenta.get_input_schema(),
+            return_direct=ferramenta.return_direct,
+            ferramenta=ferramenta,
+            cache=cache if cache is not None else CacheResultadosFerramentas(),
+            **kwargs,
+        )
 
-        for row_num in range(3,ws_destino.max_row):
-            ws_destino[f'G{row_num}'].value = f'=$E{row_num}*$F{row_num}'
-            ws_destino[f'H{row_num}'].value = f'=$G{row_num}*{percentual_custo_empresa}'
-            ws_destino[f'I{row_num}'].value = f'=$G{row_num}*{percentual_custo_empregado}'
+    def _run(
+        self,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        **kwargs,
+    ) -> Any:
 
+        arquivos_entrada = self.__arquivos_entrada(kwargs)
+        chave = self.cache.chave(self.name, kwargs, arquivos_entrada)
+        encontrado, resultado = self.__obter(chave, kwargs)
+        if encontrado:
+            return resultado
 
-        #Vamos remover todos os registros incompletos:
-        indice_matricula = excel.buscar_indice_row_por_similaridade("Matricula", ws_destino[2]) + 1
-        indice_sindicato = excel.buscar_indice_row_por_similaridade("Sindicato", ws_destino[2]) + 1
-        for row_num in range(5,ws_destino.max_row):
-            cadastro_value = ws_destino.cell(row=row_num,column=indice_matricula).value
-            if cadastro_value==None:
-                ws_destino.delete_rows(row_num,1)
-            sindicato_value = ws_destino.cell(row=row_num,column=indice_sindicato).value
-            if sindicato_value==None:
-                ws_destino.delete_rows(row_num,1)
+        resultado = self.ferramenta._run(**kwargs, run_manager=run_manager)
+        self.cache.guardar(chave, resultado)
 
-        excel.autofit(ws_destino)
+        return resultado
 
-        wb_destino.save(path_destino)
+    async def _arun(
+        self,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+        **kwargs,
+    ) -> Any:
+
+        # A consulta ao cache (que calcula o hash dos arquivos) e a execução são feitas com os arquivos bloqueados,
+        # chamando o _run da ferramenta diretamente, já que os locks não são reentrantes.
+        arquivos_entrada = self.__arquivos_entrada(kwargs)
+        async with bloquear_arquivos(arquivos_entrada):
+            chave = await executar_em_thread(self.cache.chave, self.name, kwargs, arquivos_entrada)
+            encontrado, resultado = self.__obter(chave, kwargs)
+            if encontrado:
+                return resultado
+
+            resultado = await executar_em_thread(
+                self.ferramenta._run, **kwargs, run_manager=run_manager.get_sync() if run_manager else None
+            )
+            self.cache.guardar(chave, resultado)
+
+        return resultado
+
+    def __arquivos_entrada(self, kwargs: dict) -> List[str]:
+        if hasattr(self.ferramenta, "arquivos_entrada"):
+            return self.ferramenta.arquivos_entrada(**kwargs)
+        return caminhos_arquivos(kwargs)
+
+    def __obter(self, chave: str, kwargs: dict) -> tuple[bool, Any]:
+        encontrado, resultado = self.cache.obter(chave)
+        if encontrado:
+            logger.info("Cache de ferramentas: hit de %s com os argumentos %s.", self.name, kwargs)
+        else:
+            logger.info("Cache de ferramentas: miss de %s com os argumentos %s.", self.name, kwargs)
+        return encontrado, resultado
 
-        logger.info(f"Planilha {path_destino} preenchida.")
 
-        return path_destino
+def caminhos_arquivos(valor: Any) -> List[str]:
+    """
+    Caminhos de arquivos existentes contidos em um valor (string, inclusive separada por vírgulas, lista ou dict).
+    """
+    if isinstance(valor, dict):
+        return [path for v in valor.values() for path in caminhos_arquivos(v)]
+    if isinstance(valor, (list, tuple)):
+        return [path for v in valor for path in caminhos_arquivos(v)]
+    if isinstance(valor, str):
+        candidatos = [valor] + ([_.strip() for _ in valor.split(",")] if "," in valor else [])
+        return [path for path in candidatos if os.path.isfile(path)]
+    return []
 
 
 import atexit
-import shutil
 import tempfile
 
 
 class PlanilhaTemporaria:
+    """
+    Planilhas intermediárias trocadas entre as ferramentas. Por padrão são gravadas em Parquet, bem mais rápido
+    de gravar e ler do que Excel; a variável de ambiente FORMATO_PLANILHA_TEMPORARIA=xlsx restaura o Excel.
+    """
 
     def __init__(self):
         self.__temp_dir = tempfile.mkdtemp()
+        self.__extensao = "." + os.environ.get("FORMATO_PLANILHA_TEMPORARIA", "parquet")
         atexit.register(self.__cleanup_function, "Closing files")
 
     def exportar_dados_planilha_temporaria(
-        self, df: type[pd.DataFrame], filename: str
+        self, df: "pd.DataFrame", filename: str
     ) -> str:
-        excel_destino = os.path.join(self.obter_caminho_arquivo_temporario(filename))
-        df.to_excel(excel_destino)
+        import excel
+
+        excel_destino = excel.gravar_planilha(
+            df, self.obter_caminho_planilha_temporaria(os.path.splitext(filename)[0])
+        )
         logger.info(f"Os dados foram escritos com sucesso em {excel_destino}")
         return excel_destino
 
+    def obter_caminho_planilha_temporaria(self, nome: str) -> str:
+        return self.obter_caminho_arquivo_temporario(nome + self.__extensao)
+
     def obter_caminho_arquivo_temporario(self, filename: str) -> str:
 #        return  os.path.join('data/',filename)
         return os.path.join(self.__temp_dir, filename)
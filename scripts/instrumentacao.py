@@ -0,0 +1,287 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def rss_pico_processo_mb() -> float:
+    """
+    Pico de memória residente do processo desde o seu início (o ru_maxrss é em KB no Linux e em bytes no macOS).
+    Não diminui ao longo da execução, de modo que não mede a memória usada por uma etapa isoladamente.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def rss_atual_mb() -> Optional[float]:
+    """
+    Memória residente atual do processo, lida de /proc/self/statm; None onde ele não existe (macOS e Windows).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class Etapa:
+    """
+    Medição de uma etapa da execução: uma chamada de LLM, de ferramenta ou de uma função instrumentada. A
+    memória da etapa é a variação da memória residente entre o início e o fim (picos transitórios liberados antes
+    do fim não aparecem). O tempo de CPU é o do processo inteiro durante a etapa e, com etapas concorrentes em
+    outras threads (agente assíncrono), inclui o trabalho delas.
+    """
+
+    def __init__(self, tipo: str, nome: str, pai: Optional["Etapa"] = None):
+        self.tipo = tipo
+        self.nome = nome
+        self.pai = pai
+        self.nivel = pai.nivel + 1 if pai is not None else 0
+        self.inicio = time.time()
+        self.linhas = None
+        self.tokens_entrada = None
+        self.tokens_saida = None
+        self.erro = None
+        self.__wall = time.perf_counter()
+        self.__cpu = time.process_time()
+        self.__rss = rss_atual_mb()
+        self.wall_s = None
+        self.cpu_processo_s = None
+        self.rss_delta_mb = None
+        self.rss_pico_processo_mb = None
+
+    def finalizar(self, erro: Optional[BaseException] = None) -> "Etapa":
+        self.wall_s = time.perf_counter() - self.__wall
+        self.cpu_processo_s = time.process_time() - self.__cpu
+        rss = rss_atual_mb()
+        self.rss_delta_mb = rss - self.__rss if rss is not None and self.__rss is not None else None
+        self.rss_pico_processo_mb = rss_pico_processo_mb()
+        if erro is not None:
+            self.erro = repr(erro)
+        return self
+
+    def como_dict(self) -> dict:
+        etapa = {
+            "tipo": self.tipo,
+            "nome": self.nome,
+            "nivel": self.nivel,
+            "pai": self.pai.nome if self.pai is not None else None,
+            "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="milliseconds"),
+            "wall_s": round(self.wall_s, 6) if self.wall_s is not None else None,
+            "cpu_processo_s": round(self.cpu_processo_s, 6) if self.cpu_processo_s is not None else None,
+            "rss_delta_mb": round(self.rss_delta_mb, 1) if self.rss_delta_mb is not None else None,
+            "rss_pico_processo_mb": (
+                round(self.rss_pico_processo_mb, 1) if self.rss_pico_processo_mb is not None else None
+            ),
+        }
+        for chave in ("linhas", "tokens_entrada", "tokens_saida", "erro"):
+            if getattr(self, chave) is not None:
+                etapa[chave] = getattr(self, chave)
+        return etapa
+
+
+class RegistroExecucao:
+    """
+    Registro das etapas de uma execução (agente ou pipeline). As etapas de cada thread são aninhadas pela pilha
+    de etapas em andamento, de modo que, por exemplo, um salvamento aparece dentro da ferramenta que o fez.
+    """
+
+    def __init__(self):
+        self.etapas = []
+        self.turnos = []
+        self.__pilhas = threading.local()
+        self.__lock = threading.Lock()
+        self.__inicio = time.time()
+        self.__wall = time.perf_counter()
+        self.__cpu = time.process_time()
+        self.__rss = rss_atual_mb()
+
+    def iniciar(self, tipo: str, nome: str, pai: Optional[Etapa] = None) -> Etapa:
+        pilha = self.__pilha()
+        etapa = Etapa(tipo, nome, pai if pai is not None else (pilha[-1] if pilha else None))
+        pilha.append(etapa)
+        with self.__lock:
+            self.etapas.append(etapa)
+        return etapa
+
+    def finalizar(self, etapa: Etapa, erro: Optional[BaseException] = None) -> None:
+        etapa.finalizar(erro)
+        pilha = self.__pilha()
+        if etapa in pilha:
+            pilha.remove(etapa)
+
+    def etapa_atual(self) -> Optional[Etapa]:
+        pilha = self.__pilha()
+        return pilha[-1] if pilha else None
+
+    def relatorio(self) -> dict:
+        with self.__lock:
+            etapas = [etapa for etapa in self.etapas if etapa.wall_s is not None]
+            turnos = list(self.turnos)
+
+        resumo = {}
+        for etapa in etapas:
+            item = resumo.setdefault(
+                f"{etapa.tipo}:{etapa.nome}", {"chamadas": 0, "wall_s": 0.0, "cpu_processo_s": 0.0, "linhas": 0}
+            )
+            item["chamadas"] += 1
+            item["wall_s"] += etapa.wall_s
+            item["cpu_processo_s"] += etapa.cpu_processo_s
+            item["linhas"] += etapa.linhas or 0
+        for item in resumo.values():
+            item["wall_s"] = round(item["wall_s"], 6)
+            item["cpu_processo_s"] = round(item["cpu_processo_s"], 6)
+
+        rss = rss_atual_mb()
+
+        return {
+            "inicio": datetime.fromtimestamp(self.__inicio).isoformat(timespec="milliseconds"),
+            "wall_s": round(time.perf_counter() - self.__wall, 6),
+            "cpu_processo_s": round(time.process_time() - self.__cpu, 6),
+            "rss_delta_mb": round(rss - self.__rss, 1) if rss is not None and self.__rss is not None else None,
+            "rss_pico_processo_mb": round(rss_pico_processo_mb(), 1),
+            "tokens_entrada": sum(etapa.tokens_entrada or 0 for etapa in etapas),
+            "tokens_saida": sum(etapa.tokens_saida or 0 for etapa in etapas),
+            "resumo": dict(sorted(resumo.items(), key=lambda item: -item[1]["wall_s"])),
+            "turnos": self.__turnos(etapas, turnos),
+            "etapas": [etapa.como_dict() for etapa in etapas],
+        }
+
+    def registrar_turno(self, dados: dict) -> None:
+        with self.__lock:
+            self.turnos.append(dados)
+
+    @staticmethod
+    def __turnos(etapas: list, turnos: list) -> list:
+        # Cada turno do agente é uma chamada de LLM; os dados do contexto de cada turno (ver
+        # contexto.CompactadorScratchpad) são registrados antes da chamada correspondente.
+        chamadas_llm = [etapa for etapa in etapas if etapa.tipo == "llm"]
+        resultado = []
+        for i in range(max(len(chamadas_llm), len(turnos))):
+            turno = {"turno": i + 1}
+            if i < len(turnos):
+                turno.update(turnos[i])
+            if i < len(chamadas_llm):
+                turno.update(
+                    wall_s=round(chamadas_llm[i].wall_s, 6),
+                    tokens_entrada=chamadas_llm[i].tokens_entrada,
+                    tokens_saida=chamadas_llm[i].tokens_saida,
+                )
+            resultado.append(turno)
+        return resultado
+
+    def __pilha(self) -> list:
+        if not hasattr(self.__pilhas, "etapas"):
+            self.__pilhas.etapas = []
+        return self.__pilhas.etapas
+
+
+__registro: Optional[RegistroExecucao] = None
+
+
+def registro_atual() -> Optional[RegistroExecucao]:
+    return __registro
+
+
+def medir(funcao: Optional[Callable] = None, *, nome: Optional[str] = None, tipo: str = "funcao") -> Callable:
+    """
+    Decorator que registra cada chamada da função como uma etapa da execução em andamento. Fora de uma
+    execução instrumentada a função é chamada diretamente, sem custo adicional relevante.
+    """
+
+    def decorator(funcao: Callable) -> Callable:
+        nome_etapa = nome or f"{funcao.__module__}.{funcao.__name__}"
+
+        @functools.wraps(funcao)
+        def wrapper(*args, **kwargs):
+            registro = registro_atual()
+            if registro is None:
+                return funcao(*args, **kwargs)
+
+            etapa = registro.iniciar(tipo, nome_etapa)
+            try:
+                resultado = funcao(*args, **kwargs)
+            except BaseException as e:
+                registro.finalizar(etapa, e)
+                raise
+            registro.finalizar(etapa)
+            return resultado
+
+        return wrapper
+
+    return decorator(funcao) if funcao is not None else decorator
+
+
+def registrar_linhas(linhas: int) -> None:
+    """
+    Informa a quantidade de linhas processadas pela etapa em andamento, se houver uma execução instrumentada.
+    """
+    registro = registro_atual()
+    etapa = registro.etapa_atual() if registro is not None else None
+    if etapa is not None:
+        etapa.linhas = (etapa.linhas or 0) + int(linhas)
+
+
+def registrar_turno(dados: dict) -> None:
+    """
+    Registra os dados do contexto de um turno do agente, se houver uma execução instrumentada.
+    """
+    registro = registro_atual()
+    if registro is not None:
+        registro.registrar_turno(dados)
+
+
+@contextmanager
+def instrumentar(
+    caminho_relatorio: Optional[str] = None, caminho_perfil: Optional[str] = None
+) -> Iterator[RegistroExecucao]:
+    """
+    Instrumenta a execução do bloco. Ao final, grava o relatório em JSON em caminho_relatorio e, se
+    caminho_perfil for informado, o perfil do cProfile (que pode ser lido com pstats ou snakeviz).
+    """
+    global __registro
+
+    registro = RegistroExecucao()
+    registro_anterior, __registro = __registro, registro
+
+    perfil = cProfile.Profile() if caminho_perfil else None
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield registro
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        __registro = registro_anterior
+
+        relatorio = registro.relatorio()
+        logger.info(
+            "Execução concluída em %.3f s (CPU do processo %.3f s, pico de memória do processo %.1f MB, "
+            "%d tokens de entrada e %d de saída).",
+            relatorio["wall_s"],
+            relatorio["cpu_processo_s"],
+            relatorio["rss_pico_processo_mb"],
+            relatorio["tokens_entrada"],
+            relatorio["tokens_saida"],
+        )
+
+        if caminho_relatorio:
+            os.makedirs(os.path.dirname(os.path.abspath(caminho_relatorio)), exist_ok=True)
+            with open(caminho_relatorio, "w", encoding="utf-8") as f:
+                json.dump(relatorio, f, ensure_ascii=False, indent=2, default=str)
+            logger.info("Relatório da execução gravado em %s.", caminho_relatorio)
+
+        if perfil is not None:
+            perfil.dump_stats(caminho_perfil)
+            logger.info("Perfil da execução gravado em %s.", caminho_perfil)
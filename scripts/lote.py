@@ -0,0 +1,161 @@
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de processos que executam as competências em paralelo.
+MAX_PROCESSOS_LOTE = int(os.environ.get("MAX_PROCESSOS_LOTE", os.cpu_count() or 1))
+
+
+def ler_trabalhos(path: str) -> list[dict]:
+    """
+    Lê a lista de trabalhos do lote de um arquivo JSON (lista de objetos) ou CSV (com cabeçalho). Cada trabalho
+    tem o arquivo compactado (arquivo_zip) e a competência no formato MM.AAAA (competencia) e, opcionalmente,
+    o nome da planilha final contida no arquivo (planilha_final) e a pasta de saída (saida).
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if os.path.splitext(path)[1].lower() == ".csv":
+            trabalhos = [{k.strip(): v.strip() for k, v in linha.items() if v} for linha in csv.DictReader(f)]
+        else:
+            trabalhos = json.load(f)
+
+    for num_trabalho, trabalho in enumerate(trabalhos, start=1):
+        faltantes = [campo for campo in ("arquivo_zip", "competencia") if not trabalho.get(campo)]
+        if faltantes:
+            raise ValueError(f"O trabalho {num_trabalho} de {path} não informa {', '.join(faltantes)}.")
+
+    return trabalhos
+
+
+def executar_lote(
+    trabalhos: list[dict], pasta_saida: Optional[str] = None, max_processos: Optional[int] = None
+) -> list[dict]:
+    """
+    Executa o pipeline de cada trabalho (arquivo compactado e competência) em paralelo, em processos separados,
+    retornando o resumo de cada um na mesma ordem dos trabalhos. Cada processo executa vários trabalhos, de modo
+    que as importações, as referências (estados dos sindicatos e valores por estado) e os scores dos cabeçalhos
+    são carregados uma única vez por processo. O índice dos estados dos sindicatos é montado ao iniciar cada
+    processo, o que funciona com qualquer método de início (fork no Linux, spawn no macOS e no Windows). Cada
+    trabalho é gravado na sua própria pasta de saída, com o relatório da sua execução, e a falha de um trabalho
+    não interrompe os demais.
+    """
+    pasta_saida = pasta_saida or os.environ.get("OUTPUT_FOLDER", "output")
+    if max_processos is None:
+        max_processos = MAX_PROCESSOS_LOTE
+    trabalhos = [__normalizar_trabalho(trabalho, pasta_saida) for trabalho in trabalhos]
+
+    if max_processos <= 1 or len(trabalhos) <= 1:
+        resumos = [executar_trabalho(trabalho) for trabalho in trabalhos]
+    else:
+        logger.info(
+            "Executando %d competências em paralelo com até %d processos...",
+            len(trabalhos),
+            max_processos,
+        )
+        with ProcessPoolExecutor(
+            max_workers=min(max_processos, len(trabalhos)), initializer=__inicializar_processo
+        ) as executor:
+            resumos = list(executor.map(executar_trabalho, trabalhos))
+
+    os.makedirs(pasta_saida, exist_ok=True)
+    path_resumo = os.path.join(pasta_saida, "resumo_lote.json")
+    with open(path_resumo, "w", encoding="utf-8") as f:
+        json.dump(resumos, f, ensure_ascii=False, indent=2, default=str)
+
+    for resumo in resumos:
+        logger.info(
+            "%s %s: %s em %.1f s, %s linhas, planilha %s.",
+            resumo["arquivo_zip"],
+            resumo["competencia"],
+            resumo["status"],
+            resumo["wall_s"],
+            resumo.get("linhas", "-"),
+            resumo.get("planilha_final") or resumo.get("erro"),
+        )
+    logger.info("Resumo do lote gravado em %s.", path_resumo)
+
+    return resumos
+
+
+def executar_trabalho(trabalho: dict) -> dict:
+    """
+    Executa o pipeline de um trabalho na pasta de saída dele, retornando o resumo da execução.
+    """
+    import cabecalhos
+    from pipeline import PipelineVR
+
+    # As ferramentas leem as pastas de entrada e de saída do ambiente; cada processo executa um trabalho por vez.
+    os.environ["DATA_FOLDER"] = trabalho["pasta_dados"]
+    os.environ["OUTPUT_FOLDER"] = trabalho["saida"]
+    os.makedirs(trabalho["saida"], exist_ok=True)
+    # O resolvedor de cabeçalhos é criado uma vez por processo; os aliases ficam na pasta de saída de cada trabalho.
+    cabecalhos.obter_resolvedor().usar_arquivo(cabecalhos.arquivo_aliases())
+
+    resumo: dict[str, Any] = {
+        "arquivo_zip": trabalho["arquivo_zip"],
+        "competencia": trabalho["competencia"],
+        "saida": trabalho["saida"],
+        "pid": os.getpid(),
+    }
+    inicio = time.perf_counter()
+    path_relatorio = os.path.join(trabalho["saida"], "relatorio_execucao.json")
+    try:
+        with instrumentacao.instrumentar(path_relatorio) as registro:
+            resumo["planilha_final"] = PipelineVR(
+                arquivo_zip=os.path.basename(trabalho["arquivo_zip"]),
+                competencia=trabalho["competencia"],
+                planilha_final=trabalho["planilha_final"],
+            ).executar()
+        resumo["status"] = "ok"
+        resumo["linhas"] = sum(
+            etapa.linhas or 0 for etapa in registro.etapas if etapa.nome == "excel.escrever_planilha_final"
+        )
+        resumo["relatorio"] = path_relatorio
+    except Exception as e:
+        logger.exception("Falha no trabalho %s %s.", trabalho["arquivo_zip"], trabalho["competencia"])
+        resumo["status"] = "erro"
+        resumo["erro"] = repr(e)
+    finally:
+        resumo["wall_s"] = round(time.perf_counter() - inicio, 3)
+        # Os processos do lote não executam os handlers de atexit, por isso os aliases são gravados aqui.
+        cabecalhos.obter_resolvedor().salvar()
+
+    return resumo
+
+
+def __normalizar_trabalho(trabalho: dict, pasta_saida: str) -> dict:
+    arquivo_zip = os.path.abspath(
+        trabalho["arquivo_zip"]
+        if os.path.dirname(trabalho["arquivo_zip"])
+        else os.path.join(os.environ.get("DATA_FOLDER", "data"), trabalho["arquivo_zip"])
+    )
+    competencia = trabalho["competencia"]
+    nome_zip = os.path.splitext(os.path.basename(arquivo_zip))[0]
+
+    return {
+        "arquivo_zip": arquivo_zip,
+        "pasta_dados": os.path.dirname(arquivo_zip),
+        "competencia": competencia,
+        "planilha_final": trabalho.get("planilha_final") or f"VR MENSAL {competencia}.xlsx",
+        "saida": os.path.abspath(trabalho.get("saida") or os.path.join(pasta_saida, f"{nome_zip} {competencia}")),
+    }
+
+
+def __inicializar_processo() -> None:
+    # As ferramentas são importadas e o índice dos estados dos sindicatos é montado uma única vez por processo,
+    # antes do primeiro trabalho; com spawn, nada é herdado do processo principal.
+    import excel
+    import pipeline
+    import referencias
+
+    referencias.obter_referencias()
+
+    # O paralelismo do lote é entre as competências: a leitura das planilhas de cada uma não abre mais processos.
+    excel.MAX_PROCESSOS_LEITURA = 1
@@ -1,6 +1,8 @@
+import argparse
 import logging
+import os
 
-from agente_vr import AgenteVR
+import instrumentacao
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,8 +13,81 @@ logging.basicConfig(
 
 def main():
 
-    agente_vr = AgenteVR()
-    agente_vr.invoke("Executar as instruções corretamente.")
+    parser = argparse.ArgumentParser(description="Geração da planilha de VR/VA.")
+    parser.add_argument(
+        "--modo",
+        choices=["agente", "pipeline", "lote"],
+        default=os.environ.get("MODO_EXECUCAO", "agente"),
+        help="agente: o agente ReAct executa as instruções; pipeline: as mesmas ferramentas são executadas em ordem fixa, sem LLM; lote: o pipeline é executado para cada trabalho de --trabalhos, em paralelo.",
+    )
+    parser.add_argument("--instrucao", default="Executar as instruções corretamente.")
+    parser.add_argument(
+        "--assincrono",
+        action="store_true",
+        default=os.environ.get("EXECUCAO_ASSINCRONA", "0") == "1",
+        help="Executa o agente de forma assíncrona, com as ações independentes executadas ao mesmo tempo.",
+    )
+    parser.add_argument("--arquivo-zip", help="Arquivo compactado com as planilhas (modo pipeline).")
+    parser.add_argument("--planilha-final", help="Planilha final a ser preenchida (modo pipeline).")
+    parser.add_argument("--competencia", help="Competência no formato MM.AAAA (modo pipeline).")
+    parser.add_argument(
+        "--trabalhos",
+        help="Arquivo JSON ou CSV com os trabalhos do lote (arquivo_zip, competencia e, opcionalmente, planilha_final e saida).",
+    )
+    parser.add_argument("--processos", type=int, help="Quantidade máxima de processos do lote.")
+    parser.add_argument(
+        "--relatorio",
+        default=os.environ.get(
+            "RELATORIO_EXECUCAO",
+            os.path.join(os.environ.get("OUTPUT_FOLDER", "output"), "relatorio_execucao.json"),
+        ),
+        help="Relatório em JSON com o tempo, a CPU, a memória, as linhas e os tokens de cada etapa (vazio para não gravar).",
+    )
+    parser.add_argument(
+        "--perfil",
+        default=os.environ.get("PERFIL_EXECUCAO"),
+        help="Arquivo em que o perfil do cProfile da execução será gravado.",
+    )
+    args = parser.parse_args()
+
+    with instrumentacao.instrumentar(args.relatorio or None, args.perfil):
+        executar(args)
+
+    # Importados somente aqui, depois da execução, para não atrasar a inicialização.
+    import cabecalhos
+    import excel
+
+    logging.info("Estatísticas do cache de planilhas: %s", excel.estatisticas_cache())
+    logging.info("Estatísticas do resolvedor de cabeçalhos: %s", cabecalhos.obter_resolvedor().estatisticas())
+
+
+def executar(args: argparse.Namespace) -> None:
+    if args.modo == "lote":
+        import lote
+
+        if not args.trabalhos:
+            raise SystemExit("Informe o arquivo de trabalhos do lote com --trabalhos.")
+        lote.executar_lote(lote.ler_trabalhos(args.trabalhos), max_processos=args.processos)
+    elif args.modo == "pipeline":
+        from pipeline import PipelineVR
+
+        parametros = {
+            "arquivo_zip": args.arquivo_zip,
+            "planilha_final": args.planilha_final,
+            "competencia": args.competencia,
+        }
+        PipelineVR(**{k: v for k, v in parametros.items() if v}).executar()
+    else:
+        from agente_vr import AgenteVR
+
+        if args.assincrono:
+            import asyncio
+
+            agente_vr = AgenteVR(acoes_concorrentes=True)
+            asyncio.run(agente_vr.ainvoke(args.instrucao))
+        else:
+            agente_vr = AgenteVR()
+            agente_vr.invoke(args.instrucao)
 
 
 if __name__ == "__main__":
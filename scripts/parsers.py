@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import ast
 import json
 import logging
 import re
-from typing import Union
+from typing import Any, List, NoReturn, Union
 
 from langchain.agents.agent import AgentOutputParser
 from langchain_core.agents import AgentAction, AgentFinish
@@ -11,58 +12,134 @@ from langchain_core.exceptions import OutputParserException
 
 logger = logging.getLogger(__name__)
 
+# Formato esperado das ações, repetido nas mensagens de erro devolvidas à LLM.
+ACTION_FORMAT = 'Action: <tool name>\nAction Input: {"<argument>": "<value>"}'
+
 
 class CustomAgentOutputParser(AgentOutputParser):
+    """
+    Parser das respostas do agente ReAct. A resposta é percorrida uma única vez, separando os trechos iniciados
+    pelos marcadores do formato (Thought, Action, Action Input, Observation e Final Answer) no início de uma
+    linha. Os erros são devolvidos à LLM (handle_parsing_errors) com a causa e o formato esperado, para que ela
+    corrija a resposta na tentativa seguinte.
+    """
+
+    # Marcador no início de uma linha, aceitando o negrito do markdown (**Action:**).
+    _MARKER_PATTERN = re.compile(
+        r"^[ \t*]*(Final Answer|Action Input|Action|Thought|Observation)[ \t*]*:[ \t*]*", re.MULTILINE
+    )
 
-    def parse(self, text: str) -> Union[AgentAction, AgentFinish]:
+    def parse(self, text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
 
         logger.debug("Text received:|%s|", text)
 
-        if text and text[-1] != "\n":
-            text += "\n"
-
-        final_answer_prefix = "Final Answer:"
-        final_answer_block = self._parse_block(final_answer_prefix, text)
-        if final_answer_block:
-            final_answer = final_answer_block[len(final_answer_prefix) :]
-            return AgentFinish({"output": final_answer}, text)
-        else:
-            action_prefix = "Action: "
-            action_block = self._parse_block(action_prefix, text)
-            if not action_block:
-                msg = f"Could not parse LLM Output: {text}"
-                raise OutputParserException(msg)
-
-            logger.debug("Action_block: |%s|", action_block)
-            action = action_block[len(action_prefix) :]
-            logger.debug("Action: |%s|", action)
-            if action is None:
-                msg = f"Could not parse action directive: {action}"
-                raise OutputParserException(msg)
-
-            # Parse out the action and the directive.
-            action_input_prefix = "Action Input: "
-            action_input_block = self._parse_block(action_input_prefix, text)
-            logger.debug("action_input_block: |%s|", action_input_block)
-            action_input = action_input_block[len(action_input_prefix) :]
-            action_input = json.loads(action_input.replace("'", '"'))
-            logger.debug("Action Input: |%s|", action_input)
-
-            return AgentAction(action, action_input, text)
-
-    def _parse_block(self, prefix: str, text: str) -> str:
-        return self._get_text_between_delimiters(text, prefix, "\n")
-
-    def _get_text_between_delimiters(self, text, start_delim, end_delim):
-        # Regex pattern to match the text between the delimiters
-        pattern = re.escape(start_delim) + "(.*?)" + re.escape(end_delim)
-        # Find all matches
-        matches = re.search(pattern, text)
-        if matches:
-            return matches.group().strip()
-        else:
-            return None
+        blocks = self._tokenize(text)
+
+        for marker, content, _ in blocks:
+            if marker == "Final Answer":
+                return AgentFinish({"output": content}, text)
+
+        actions = self._parse_actions(text, blocks)
+        logger.debug("Actions: |%s|", actions)
+        if len(actions) == 1:
+            return AgentAction(actions[0].tool, actions[0].tool_input, text)
+        return actions
+
+    def _tokenize(self, text: str) -> List[tuple[str, str, int]]:
+        """
+        Trechos (marcador, conteúdo, posição final) da resposta, até a primeira Observation, que é escrita pelo
+        AgentExecutor e não pela LLM.
+        """
+        matches = list(self._MARKER_PATTERN.finditer(text))
+        blocks = []
+        for i, match in enumerate(matches):
+            marker = match.group(1)
+            if marker == "Observation":
+                break
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            blocks.append((marker, text[match.end() : end].strip(), end))
+        return blocks
+
+    def _parse_actions(self, text: str, blocks: List[tuple[str, str, int]]) -> List[AgentAction]:
+        """
+        Ações da resposta, cada uma com o nome da ferramenta (Action) seguido dos argumentos (Action Input). Ações
+        independentes escritas em sequência são executadas concorrentemente pelo AgentExecutor assíncrono; o log
+        de cada uma é o trecho da resposta até ela, para que o histórico do agente (agent_scratchpad) mostre cada
+        ação seguida da sua observação.
+        """
+        actions = []
+        start = 0
+        tool = None
+        for marker, content, end in blocks:
+            if marker == "Action":
+                if tool is not None:
+                    self._raise(text, f"'Action: {tool}' is not followed by an 'Action Input:' line.")
+                tool = content.splitlines()[0].strip().strip("`") if content else ""
+                if not tool:
+                    self._raise(text, "'Action:' does not name a tool.")
+            elif marker == "Action Input":
+                if tool is None:
+                    self._raise(text, "'Action Input:' is not preceded by an 'Action:' line.")
+                actions.append(AgentAction(tool, self._decode_action_input(text, tool, content), text[start:end]))
+                start = end
+                tool = None
+
+        if tool is not None:
+            self._raise(text, f"'Action: {tool}' is not followed by an 'Action Input:' line.")
+        if not actions:
+            self._raise(text, "The response has neither an 'Action:' nor a 'Final Answer:'.")
+        return actions
+
+    def _decode_action_input(self, text: str, tool: str, content: str) -> dict:
+        try:
+            action_input = decode_action_input(content)
+        except ValueError as e:
+            self._raise(text, f"The Action Input of {tool} could not be read ({e}).")
+
+        if not isinstance(action_input, dict):
+            self._raise(text, f"The Action Input of {tool} must be a JSON object with the tool arguments.")
+        return action_input
+
+    @staticmethod
+    def _raise(text: str, error: str) -> NoReturn:
+        observation = f"Invalid format: {error} Use the format:\n{ACTION_FORMAT}\nor\nFinal Answer: <answer>"
+        raise OutputParserException(
+            f"Could not parse LLM output: {error}", observation=observation, llm_output=text, send_to_llm=True
+        )
 
     @property
     def _type(self) -> str:
         return "react"
+
+
+# Bloco de código do markdown em volta dos argumentos (```json ... ```).
+_CODE_FENCE_PATTERN = re.compile(r"^```[a-zA-Z]*\s*(.*?)\s*```$", re.DOTALL)
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def decode_action_input(content: str) -> Any:
+    """
+    Argumentos de uma ação escritos pela LLM: JSON, literal Python (aspas simples, True e None, comuns nos modelos
+    locais) ou, por último, JSON com aspas simples no lugar das duplas. O texto após o objeto é ignorado. Levanta
+    ValueError se nenhuma das leituras for possível.
+    """
+    content = content.strip()
+    fence = _CODE_FENCE_PATTERN.match(content)
+    if fence:
+        content = fence.group(1)
+
+    try:
+        return _JSON_DECODER.raw_decode(content)[0]
+    except ValueError as e:
+        error = e
+
+    try:
+        return ast.literal_eval(content)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+
+    try:
+        return _JSON_DECODER.raw_decode(content.replace("'", '"'))[0]
+    except ValueError:
+        raise ValueError(f"invalid JSON: {error}") from None
@@ -0,0 +1,151 @@
+import logging
+import os
+from typing import Any, Optional
+
+from langchain_core.tools.base import BaseTool
+
+from callbacks import CallbackInstrumentacao
+from ferramentas import *
+
+logger = logging.getLogger(__name__)
+
+# Etapas fixas do instructions.md, executadas sem LLM. Nos argumentos, "$nome" referencia o resultado de uma
+# etapa anterior, "$nome:PREFIXO" o arquivo da lista de resultados cujo nome começa com PREFIXO e "{parametro}"
+# um dos parâmetros do pipeline.
+ETAPAS_VR = [
+    {
+        "ferramenta": "Unzip",
+        "argumentos": {"nome_arquivo": "{arquivo_zip}", "diretorio": "data"},
+        "resultado": "arquivos",
+    },
+    {
+        "ferramenta": "ReunirDados",
+        "argumentos": {
+            "paths": [
+                "$arquivos:ATIVOS",
+                "$arquivos:FERIAS",
+                "$arquivos:DESLIGADOS",
+                "$arquivos:ADMISSAO",
+                "$arquivos:Base dias uteis",
+            ]
+        },
+        "resultado": "colaboradores",
+    },
+    {
+        "ferramenta": "RemoverDadosNaPlanilha",
+        "argumentos": {
+            "path_planilha_dados_colaboradores": "$colaboradores",
+            "cargos": "{cargos_removidos}",
+        },
+    },
+    {
+        "ferramenta": "EstadosDosSindicatos",
+        "argumentos": {"path_planilha_dados_colaboradores": "$colaboradores"},
+        "resultado": "colaboradores",
+    },
+    {
+        "ferramenta": "ValoresDosEstados",
+        "argumentos": {
+            "path_planilha_dados_colaboradores": "$colaboradores",
+            "planilha_valores": "$arquivos:Base sindicato x valor",
+        },
+        "resultado": "colaboradores",
+    },
+    {
+        "ferramenta": "EscreverDadosNaPlanilha",
+        "argumentos": {
+            "path_origem": "$colaboradores",
+            "path_destino": "$arquivos:{planilha_final}",
+            "competencia": "{competencia}",
+            "percentual_custo_empresa": 80,
+            "percentual_custo_empregado": 20,
+        },
+        "resultado": "planilha_final",
+    },
+]
+
+PARAMETROS_VR = {
+    "arquivo_zip": "Desafio 4 - Dados.zip",
+    "planilha_final": "VR MENSAL 05.2025.xlsx",
+    "competencia": "05.2025",
+    "cargos_removidos": "diretores,estagiários,férias,exterior",
+}
+
+
+class PipelineVR:
+    """
+    Execução determinística das instruções do agente: as mesmas ferramentas do agente são chamadas em uma ordem
+    fixa e com argumentos explícitos, sem nenhuma LLM no circuito.
+    """
+
+    def __init__(
+        self,
+        etapas: Optional[list[dict]] = None,
+        tools: Optional[list[BaseTool]] = None,
+        **parametros,
+    ):
+        self.__etapas = etapas if etapas is not None else ETAPAS_VR
+        self.__parametros = {**PARAMETROS_VR, **parametros}
+        self.__tools = {
+            tool.name: tool
+            for tool in (
+                tools
+                if tools is not None
+                else [
+                    UnzipFileTool(),
+                    ReunirDadosTool(),
+                    EscreverDadosNaPlanilhaTool(),
+                    EstadosDosSindicatosTool(),
+                    ValoresDosEstadosTool(),
+                    RemoverColaboradoresNaPlanilhaTool(),
+                ]
+            )
+        }
+
+    def executar(self) -> Any:
+        resultados = {}
+        resultado = None
+        callbacks = [CallbackInstrumentacao()]
+
+        for num_etapa, etapa in enumerate(self.__etapas, start=1):
+            tool = self.__tools[etapa["ferramenta"]]
+            argumentos = self.__resolver(etapa["argumentos"], resultados)
+
+            logger.info(
+                "Etapa %d/%d: executando %s com os argumentos %s...",
+                num_etapa,
+                len(self.__etapas),
+                tool.name,
+                argumentos,
+            )
+            resultado = tool.invoke(argumentos, config={"callbacks": callbacks})
+
+            if "resultado" in etapa:
+                resultados[etapa["resultado"]] = resultado
+
+        logger.info("Pipeline concluído com o resultado %s.", resultado)
+
+        return resultado
+
+    def __resolver(self, valor: Any, resultados: dict) -> Any:
+        if isinstance(valor, dict):
+            return {chave: self.__resolver(v, resultados) for chave, v in valor.items()}
+        if isinstance(valor, list):
+            return [self.__resolver(v, resultados) for v in valor]
+        if not isinstance(valor, str):
+            return valor
+
+        valor = valor.format(**self.__parametros)
+        if not valor.startswith("$"):
+            return valor
+
+        nome, _, prefixo = valor[1:].partition(":")
+        if nome not in resultados:
+            raise ValueError(f"A etapa que produz o resultado {nome} ainda não foi executada.")
+        if not prefixo:
+            return resultados[nome]
+
+        for path in resultados[nome]:
+            if os.path.basename(path).lower().startswith(prefixo.lower()):
+                return path
+        raise ValueError(f"Nenhum arquivo de {nome} começa com {prefixo}.")
@@ -0,0 +1,68 @@
+from langchain_core.prompts import PromptTemplate
+
+# Cópia local do prompt langchain-ai/react-agent-template do LangChain Hub, para que o agente não dependa de
+# acesso à rede na inicialização. As instruções de negócio (instructions.md) entram em {instructions}.
+REACT_AGENT_TEMPLATE = """{instructions}
+
+TOOLS:
+------
+
+You have access to the following tools:
+
+{tools}
+
+To use a tool, please use the following format:
+
+```
+Thought: Do I need to use a tool? Yes
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+```
+
+When you have a response to say to the Human, or if you do not need to use a tool, you MUST use the format:
+
+```
+Thought: Do I need to use a tool? No
+Final Answer: [your response here]
+```
+
+Begin!
+
+Previous conversation history:
+{chat_history}
+
+New input: {input}
+{agent_scratchpad}"""
+
+
+# Acrescentado às instruções quando o agente pode executar ações independentes ao mesmo tempo.
+CONCURRENT_ACTIONS_INSTRUCTIONS = """
+
+When you need several actions that do not depend on each other's results (for example, two tools that read
+different files), you may write them one after another in the same response, each with its own Action and
+Action Input lines, before any Observation. They will be executed at the same time."""
+
+# Acrescentado às instruções quando as observações das ferramentas trazem handles dos arquivos (ver contexto.py).
+ARTIFACT_HANDLES_INSTRUCTIONS = """
+
+Files produced by the tools are shown in the observations as short handles followed by the file name, for
+example arq3=ADMISSAO ABRIL.xlsx. Wherever a tool expects a file path, you may pass the handle (arq3) instead."""
+
+
+def react_agent_prompt(
+    instructions: str, concurrent_actions: bool = False, artifact_handles: bool = False
+) -> PromptTemplate:
+    """
+    Prompt ReAct do agente com as instruções preenchidas e sem histórico de conversa anterior. Com
+    concurrent_actions, o prompt permite várias ações independentes em uma mesma resposta; com
+    artifact_handles, explica os handles de arquivos usados nas observações.
+    """
+    if concurrent_actions:
+        instructions += CONCURRENT_ACTIONS_INSTRUCTIONS
+    if artifact_handles:
+        instructions += ARTIFACT_HANDLES_INSTRUCTIONS
+
+    return PromptTemplate.from_template(REACT_AGENT_TEMPLATE).partial(
+        instructions=instructions, chat_history=""
+    )
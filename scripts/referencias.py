@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+import cabecalhos
+import excel
+import similaridade
+
+logger = logging.getLogger(__name__)
+
+# Estado de cada sindicato dos colaboradores.
+SINDICATOS_ESTADOS = {
+    "SINDPD RJ - SINDICATO PROFISSIONAIS DE PROC DADOS DO RIO DE JANEIRO": "Rio de Janeiro",
+    "SINDPPD RS - SINDICATO DOS TRAB. EM PROC. DE DADOS RIO GRANDE DO SUL": "Rio Grande do Sul",
+    "SINDPD SP - SIND.TRAB.EM PROC DADOS E EMPR.EMPRESAS PROC DADOS ESTADO DE SP.": "São Paulo",
+    "SITEPD PR - SIND DOS TRAB EM EMPR PRIVADAS DE PROC DE DADOS DE CURITIBA E REGIAO METROPOLITANA": "Paraná",
+}
+
+# Score mínimo para que uma chave sem correspondência exata seja associada à chave conhecida mais similar.
+LIMIAR_SIMILARIDADE_CHAVES = 90
+
+__RE_INVISIVEIS = re.compile(r"[\u200b-\u200d\u2060\ufeff]")
+__RE_ESPACOS = re.compile(r"\s+")
+
+
+def normalizar_chave(texto: Any) -> str:
+    """
+    Forma canônica de uma chave textual: sem acentos nem caracteres invisíveis, com os espaços (inclusive os não
+    separáveis) colapsados, em minúsculas e sem a pontuação final, de modo que "ESTADO DE SP." e "estado de sp"
+    coincidam.
+    """
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = __RE_INVISIVEIS.sub("", texto)
+    texto = __RE_ESPACOS.sub(" ", texto)
+    return texto.strip().rstrip(".;,").strip().lower()
+
+
+class IndiceReferencia:
+    """
+    Índice de uma tabela de referência (chave -> valor) pelas chaves normalizadas. A busca é por igualdade da
+    chave normalizada em um dict; apenas as chaves sem correspondência exata são comparadas por similaridade com
+    as chaves conhecidas, e o resultado dessa comparação fica guardado para as buscas seguintes.
+    """
+
+    def __init__(self, mapeamento: dict, limiar: int = LIMIAR_SIMILARIDADE_CHAVES):
+        self.limiar = limiar
+        self.__valores = {}
+        for chave, valor in mapeamento.items():
+            if chave is None or pd.isna(valor):
+                continue
+            chave_normalizada = normalizar_chave(chave)
+            if chave_normalizada:
+                self.__valores[chave_normalizada] = valor
+        self.__chaves = list(self.__valores)
+        self.__aproximadas = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__valores)
+
+    def obter(self, chave: Any, padrao: Any = None) -> Any:
+        if chave is None or (not isinstance(chave, str) and pd.isna(chave)):
+            return padrao
+
+        chave_normalizada = normalizar_chave(chave)
+        if chave_normalizada in self.__valores:
+            return self.__valores[chave_normalizada]
+
+        with self.__lock:
+            if chave_normalizada not in self.__aproximadas:
+                self.__aproximadas[chave_normalizada] = self.__buscar_aproximada(chave_normalizada)
+            chave_aproximada = self.__aproximadas[chave_normalizada]
+
+        return self.__valores[chave_aproximada] if chave_aproximada is not None else padrao
+
+    def mapear(self, chaves: pd.Series) -> pd.Series:
+        """
+        Equivalente vetorizado de obter: cada chave distinta é resolvida uma única vez e o resultado é
+        distribuído para todas as linhas com Series.map.
+        """
+        distintas = chaves.dropna().unique()
+        return chaves.map({chave: self.obter(chave) for chave in distintas})
+
+    def __buscar_aproximada(self, chave_normalizada: str) -> Optional[str]:
+        if not chave_normalizada or not self.__chaves:
+            return None
+
+        scores = similaridade.pontuar(chave_normalizada, self.__chaves)
+        j = int(np.argmax(scores))
+        if scores[j] <= self.limiar:
+            logger.warning("Nenhuma referência encontrada para %s.", chave_normalizada)
+            return None
+
+        logger.debug(
+            "A chave %s foi associada à referência %s com o score %d.",
+            chave_normalizada,
+            self.__chaves[j],
+            scores[j],
+        )
+        return self.__chaves[j]
+
+
+class ReferenciasVR:
+    """
+    Dados de referência do cálculo do VR mantidos em memória: o estado de cada sindicato e, opcionalmente, o
+    valor diário de cada estado, lido da planilha de valores uma única vez.
+    """
+
+    def __init__(self, sindicatos_estados: Optional[dict] = None, planilha_valores: Optional[str] = None):
+        self.estados = IndiceReferencia(
+            sindicatos_estados if sindicatos_estados is not None else SINDICATOS_ESTADOS
+        )
+        self.valores = (
+            IndiceReferencia(ler_valores_estados(planilha_valores)) if planilha_valores else None
+        )
+
+    def adicionar_estados(
+        self, df: pd.DataFrame, coluna_sindicato: str = "Sindicato", coluna_estado: str = "Estado"
+    ) -> pd.DataFrame:
+        df[coluna_estado] = self.estados.mapear(coluna_dataframe(df, coluna_sindicato)).to_numpy()
+        return df
+
+    def adicionar_valores(
+        self, df: pd.DataFrame, coluna_estado: str = "Estado", coluna_valor: str = "VALOR"
+    ) -> pd.DataFrame:
+        if self.valores is None:
+            raise ValueError("A planilha de valores por estado não foi informada.")
+        df[coluna_valor] = self.valores.mapear(coluna_dataframe(df, coluna_estado)).to_numpy()
+        return df
+
+
+__referencias = {}
+__hashes_planilhas = {}
+__lock_referencias = threading.Lock()
+
+
+def obter_referencias(planilha_valores: Optional[str] = None) -> ReferenciasVR:
+    """
+    Referências compartilhadas pelo processo, montadas uma única vez para cada conteúdo da planilha de valores,
+    de modo que as cópias idênticas extraídas por competências diferentes reaproveitam as mesmas referências.
+    """
+    chave = None
+    if planilha_valores:
+        stat = os.stat(planilha_valores)
+        assinatura = (os.path.abspath(planilha_valores), stat.st_mtime_ns, stat.st_size)
+        if assinatura not in __hashes_planilhas:
+            with open(planilha_valores, "rb") as f:
+                __hashes_planilhas[assinatura] = hashlib.sha256(f.read()).hexdigest()
+        chave = __hashes_planilhas[assinatura]
+
+    with __lock_referencias:
+        if chave not in __referencias:
+            __referencias[chave] = ReferenciasVR(planilha_valores=planilha_valores)
+        return __referencias[chave]
+
+
+def ler_valores_estados(planilha_valores: str) -> dict:
+    """
+    Lê a planilha de valores por estado, localizando o cabeçalho e as colunas de estado e de valor pela
+    similaridade dos nomes.
+    """
+    celulas = excel.buscar_celulas_cabecalho(planilha_valores)
+    indices = {}
+    for nome in ("Estado", "Valor"):
+        scores = cabecalhos.pontuar(nome, [normalizar_chave(texto) for _, _, texto in celulas], "partial_ratio")
+        j = int(np.argmax(scores)) if len(scores) else None
+        if j is None or scores[j] <= 90:
+            raise ValueError(f"A coluna {nome} não foi encontrada na planilha {planilha_valores}.")
+        indices[nome] = celulas[j]
+
+    row = indices["Estado"][0]
+    df = excel.ler_excel(planilha_valores, skiprows=row - 1)
+    estados = df.iloc[:, indices["Estado"][1] - 1]
+    valores = df.iloc[:, indices["Valor"][1] - 1]
+
+    return dict(zip(estados, valores))
+
+
+def coluna_dataframe(df: pd.DataFrame, nome: str) -> pd.Series:
+    """
+    Coluna (ou índice) do DataFrame cujo nome é similar ao informado.
+    """
+    nomes = [df.index.name] + list(df.columns)
+    scores = cabecalhos.pontuar(
+        nome, [normalizar_chave(n) if isinstance(n, str) else None for n in nomes], "partial_ratio"
+    )
+    j = int(np.argmax(scores))
+    if scores[j] <= 90:
+        raise ValueError(f"A coluna {nome} não foi encontrada entre {nomes}.")
+
+    if j == 0:
+        return df.index.to_series(index=df.index)
+    return df.iloc[:, j - 1]
@@ -56,10 +56,16 @@ class CalcularQuantidadeDiasUteisInput(BaseModel):
     )
 
 
+class EstadosDosSindicatosInput(BaseModel):
+    path_planilha_dados_colaboradores: str = Field(
+        description="A planilha com os dados dos colaboradores e seus sindicatos."
+    )
+
+
 class ValoresDosEstadosInput(BaseModel):
+    path_planilha_dados_colaboradores: str = Field(
+        description="A planilha com os dados dos colaboradores e os estados de seus sindicatos."
+    )
     planilha_valores: str = Field(
         description="A planilha contendo os valores por estado por extenso."
     )
-    estados: str | Optional[list[str]] = Field(
-        description="Os nomes dos estados por extenso."
-    )
@@ -0,0 +1,60 @@
+import logging
+from typing import Optional, Sequence
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+SCORERS = {
+    "ratio": fuzz.ratio,
+    "partial_ratio": fuzz.partial_ratio,
+}
+
+
+def normalizar(texto) -> str:
+    return str(texto).strip().lower()
+
+
+@instrumentacao.medir
+def matriz_similaridade(
+    consultas: Sequence[Optional[str]],
+    candidatos: Sequence[Optional[str]],
+    scorer: str = "ratio",
+    score_cutoff: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Calcula em lote os scores de similaridade (inteiros de 0 a 100, arredondados como no fuzzywuzzy) entre
+    todas as consultas e todos os candidatos, normalizando cada string uma única vez. Entradas None não são
+    comparadas e recebem score 0.
+    """
+    matriz = np.zeros((len(consultas), len(candidatos)), dtype=np.int16)
+
+    indices_consultas = [i for i, consulta in enumerate(consultas) if consulta is not None]
+    indices_candidatos = [j for j, candidato in enumerate(candidatos) if candidato is not None]
+
+    if not indices_consultas or not indices_candidatos:
+        return matriz
+
+    scores = process.cdist(
+        [normalizar(consultas[i]) for i in indices_consultas],
+        [normalizar(candidatos[j]) for j in indices_candidatos],
+        scorer=SCORERS[scorer],
+        processor=None,
+        score_cutoff=score_cutoff,
+    )
+    matriz[np.ix_(indices_consultas, indices_candidatos)] = np.rint(scores)
+
+    return matriz
+
+
+def pontuar(
+    consulta: str, candidatos: Sequence[Optional[str]], scorer: str = "ratio"
+) -> np.ndarray:
+    """
+    Scores de uma única consulta contra todos os candidatos.
+    """
+    return matriz_similaridade([consulta], candidatos, scorer)[0]
+
@@ -0,0 +1,26 @@
+import json
+
+from cabecalhos import ResolvedorCabecalhos
+
+
+def __aliases(path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["scores"]
+
+
+def test_usar_arquivo_grava_os_aliases_de_cada_trabalho_no_seu_arquivo(tmp_path):
+    trabalho1 = tmp_path / "trabalho1" / "aliases_cabecalhos.json"
+    trabalho2 = tmp_path / "trabalho2" / "aliases_cabecalhos.json"
+
+    resolvedor = ResolvedorCabecalhos()
+    resolvedor.usar_arquivo(str(trabalho1))
+    resolvedor.pontuar("Matricula", ["MATRICULA", "Cargo"])
+    resolvedor.usar_arquivo(str(trabalho2))
+    resolvedor.pontuar("Matricula", ["MATRICULA"])
+    resolvedor.pontuar("Sindicato", ["SINDICATO"])
+    resolvedor.salvar()
+
+    assert resolvedor.path == str(trabalho2)
+    assert __aliases(trabalho1) == {"ratio": {"matricula": {"matricula": 100}}}
+    assert __aliases(trabalho2) == {"ratio": {"matricula": {"matricula": 100}, "sindicato": {"sindicato": 100}}}
+    assert resolvedor.misses == 3
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import calculo
+
+
+@pytest.mark.parametrize(
+    "a, b, esperado",
+    [
+        # round(x, 2) em float arredonda estes meios centavos para baixo (1.005 é 1.00499... em binário).
+        (1.005, 1, 1.01),
+        (2.675, 1, 2.68),
+        (1.115, 1, 1.12),
+        (0.5, 0.01, 0.01),
+        (21, 37.55, 788.55),
+        (22, 37.5, 825.0),
+        (3, 0.335, 1.01),
+    ],
+)
+def test_multiplicar_arredonda_meio_centavo_para_cima(a, b, esperado):
+    assert calculo.multiplicar(pd.Series([a]), b).tolist() == [esperado]
+
+
+def test_multiplicar_mantem_nan_e_reaproveita_pares_repetidos():
+    resultado = calculo.multiplicar(pd.Series([21, np.nan, 21, 22]), pd.Series([37.55, 35.0, 37.55, np.nan]))
+
+    assert resultado[0] == resultado[2] == 788.55
+    assert np.isnan(resultado[1]) and np.isnan(resultado[3])
+
+
+def test_multiplicar_por_decimal():
+    assert calculo.multiplicar(pd.Series([1.0125]), Decimal("0.8")).tolist() == [0.81]
+
+
+@pytest.mark.parametrize(
+    "percentual, esperado",
+    [(80, Decimal("0.8")), (0.8, Decimal("0.8")), (20, Decimal("0.2")), (Decimal("80"), Decimal("0.8")), (1, 1)],
+)
+def test_normalizar_percentual(percentual, esperado):
+    assert calculo.normalizar_percentual(percentual) == esperado
+
+
+def test_calcular_vr_percentual_como_fracao_ou_porcentagem():
+    df = pd.DataFrame({"Dias": [22, 21, 3], "Valor": [37.5, 35.0, 0.335]})
+
+    assert calculo.calcular_vr(df, 80, 20).equals(calculo.calcular_vr(df, 0.8, 0.2))
+
+
+def test_calcular_vr_parcelas_fecham_o_total():
+    # Com 70%, 0.05 dá 0.035 para a empresa e 0.015 para o empregado: arredondadas separadamente, somariam 0.06.
+    df = pd.DataFrame({"Dias": [1, 1, 1, 22, 0, np.nan], "Valor": [0.05, 10.01, 12.34, 37.5, 35.0, 35.0]})
+
+    for empresa, empregado in ((80, 20), (70, 30)):
+        calculado = calculo.calcular_vr(df, empresa, empregado)
+        validos = calculado.dropna()
+        centavos = (validos * 100).round().astype(int)
+        assert (centavos["Custo empresa"] + centavos["Desconto profissional"] == centavos["TOTAL"]).all()
+        assert calculado["TOTAL"].isna().tolist() == [False, False, False, False, False, True]
+
+    calculado = calculo.calcular_vr(df, 70, 30)
+    assert calculado.loc[0].tolist() == [0.05, 0.04, 0.01]
+
+
+def test_totalizar_soma_exata_em_centavos():
+    calculado = calculo.calcular_vr(pd.DataFrame({"Dias": [1] * 10 + [22], "Valor": [0.1] * 10 + [37.5]}), 80, 20)
+
+    totais = calculo.totalizar(calculado)
+
+    assert totais == {
+        "TOTAL": Decimal("826.00"),
+        "Custo empresa": Decimal("660.80"),
+        "Desconto profissional": Decimal("165.20"),
+    }
+    assert totais["Custo empresa"] + totais["Desconto profissional"] == totais["TOTAL"]
+
+
+def test_totalizar_ignora_linhas_sem_resultado():
+    totais = calculo.totalizar(pd.DataFrame({"TOTAL": [0.1, 0.2, np.nan]}))
+
+    assert totais == {"TOTAL": Decimal("0.3")}
@@ -0,0 +1,69 @@
+import logging
+import os
+import zipfile
+from decimal import Decimal
+
+import openpyxl
+
+from ferramentas import EscreverDadosNaPlanilhaTool, UnzipFileTool
+
+
+def test_unzip_extrai_novamente_arquivo_removido_apos_extracao(tmp_path, monkeypatch):
+    dados = tmp_path / "dados"
+    saida = tmp_path / "saida"
+    dados.mkdir()
+    saida.mkdir()
+    with zipfile.ZipFile(dados / "base.zip", "w") as zip_ref:
+        zip_ref.writestr("ATIVOS.xlsx", b"ativos")
+        zip_ref.writestr("FERIAS.xlsx", b"ferias")
+    monkeypatch.setenv("DATA_FOLDER", str(dados))
+    monkeypatch.setenv("OUTPUT_FOLDER", str(saida))
+
+    ferramenta = UnzipFileTool()
+    paths = ferramenta._run("base.zip", "dados")
+    os.remove(saida / "ATIVOS.xlsx")
+
+    assert ferramenta._run("base.zip", "dados") == paths
+    assert (saida / "ATIVOS.xlsx").read_bytes() == b"ativos"
+    assert (saida / "FERIAS.xlsx").read_bytes() == b"ferias"
+
+
+def test_escrever_dados_totais_e_filtro_conferem_com_as_linhas_escritas(tmp_path, caplog):
+    origem = openpyxl.Workbook()
+    origem.active.append(
+        ["Matricula", "Admissão", "Sindicato do Colaborador", "Competência", "Dias", "VALOR DIÁRIO VR"]
+    )
+    for matricula in range(1, 101):
+        origem.active.append([matricula, None, "SINDPD SP", None, matricula % 23, 37.55 if matricula % 2 else 35.0])
+    origem.save(tmp_path / "origem.xlsx")
+
+    modelo = openpyxl.Workbook()
+    modelo.active.append([None, None, None, None, None, None, 0])
+    modelo.active.append(
+        [
+            "Matricula",
+            "Admissão",
+            "Sindicato do Colaborador",
+            "Competência",
+            "Dias",
+            "VALOR DIÁRIO VR",
+            "TOTAL",
+            "Custo empresa",
+            "Desconto profissional",
+        ]
+    )
+    modelo.active.auto_filter.ref = "A2:I500"
+    modelo.save(tmp_path / "final.xlsx")
+
+    with caplog.at_level(logging.INFO, logger="ferramentas"):
+        EscreverDadosNaPlanilhaTool()._run(
+            str(tmp_path / "origem.xlsx"), str(tmp_path / "final.xlsx"), "05.2025", 80, 20
+        )
+
+    (totais,) = [registro.args for registro in caplog.records if registro.msg.startswith("Totais calculados")]
+    ws = openpyxl.load_workbook(tmp_path / "final.xlsx").active
+    linhas = list(ws.iter_rows(min_row=3, values_only=True))
+    assert len(linhas) == 100
+    for j, coluna in enumerate(["TOTAL", "Custo empresa", "Desconto profissional"], start=6):
+        assert Decimal(totais[coluna]) == sum(Decimal(repr(linha[j])) for linha in linhas if linha[j] is not None)
+    assert ws.auto_filter.ref == "A2:I102"
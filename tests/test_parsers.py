@@ -0,0 +1,99 @@
+import pytest
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from parsers import ACTION_FORMAT, CustomAgentOutputParser, decode_action_input
+
+
+@pytest.fixture
+def parser():
+    return CustomAgentOutputParser()
+
+
+def test_acao_com_apostrofo_no_valor(parser):
+    acao = parser.parse('Thought: ler\nAction: Ler\nAction Input: {"nome": "D\'Ávila", "path": "SANT\'ANA.xlsx"}')
+
+    assert isinstance(acao, AgentAction)
+    assert acao.tool == "Ler"
+    assert acao.tool_input == {"nome": "D'Ávila", "path": "SANT'ANA.xlsx"}
+
+
+def test_acao_com_literal_python(parser):
+    acao = parser.parse(
+        "Action: Mesclar\nAction Input: {'planilhas': ['a.xlsx', \"b'c.xlsx\"], 'checkpoint': True, 'destino': None}"
+    )
+
+    assert acao.tool_input == {"planilhas": ["a.xlsx", "b'c.xlsx"], "checkpoint": True, "destino": None}
+
+
+def test_acao_em_bloco_de_codigo_e_com_marcadores_em_negrito(parser):
+    acao = parser.parse('**Thought:** mesclar\n**Action:** `Mesclar`\n**Action Input:**\n```json\n{"a": 1}\n```\n')
+
+    assert acao.tool == "Mesclar"
+    assert acao.tool_input == {"a": 1}
+
+
+def test_texto_apos_os_argumentos_e_observacao_inventada_sao_ignorados(parser):
+    acao = parser.parse('Action: Ler\nAction Input: {"a": 1} (lendo)\nObservation: inventada\nFinal Answer: fim')
+
+    assert isinstance(acao, AgentAction)
+    assert acao.tool_input == {"a": 1}
+
+
+def test_varias_acoes_na_mesma_resposta(parser):
+    texto = 'Thought: duas leituras\nAction: Ler\nAction Input: {"path": "a"}\nAction: Ler\nAction Input: {"path": "b"}'
+
+    acoes = parser.parse(texto)
+
+    assert [(acao.tool, acao.tool_input) for acao in acoes] == [("Ler", {"path": "a"}), ("Ler", {"path": "b"})]
+    # O log de cada ação é o trecho da resposta até ela; juntos, reproduzem a resposta.
+    assert acoes[0].log == 'Thought: duas leituras\nAction: Ler\nAction Input: {"path": "a"}\n'
+    assert acoes[0].log + acoes[1].log == texto
+
+
+def test_resposta_final(parser):
+    final = parser.parse("Thought: pronto\nFinal Answer: planilha gerada")
+
+    assert isinstance(final, AgentFinish)
+    assert final.return_values == {"output": "planilha gerada"}
+
+
+@pytest.mark.parametrize(
+    "texto, erro",
+    [
+        ("Vou pensar mais um pouco.", "neither an 'Action:' nor a 'Final Answer:'"),
+        ("Action: Ler\n", "'Action: Ler' is not followed by an 'Action Input:' line."),
+        ('Action Input: {"a": 1}', "'Action Input:' is not preceded by an 'Action:' line."),
+        ('Action:\nAction Input: {"a": 1}', "'Action:' does not name a tool."),
+        ("Action: Ler\nAction Input: {a: 1", "The Action Input of Ler could not be read"),
+        ('Action: Ler\nAction Input: ["a"]', "The Action Input of Ler must be a JSON object"),
+    ],
+)
+def test_resposta_malformada_devolve_observacao_estruturada(parser, texto, erro):
+    with pytest.raises(OutputParserException) as excinfo:
+        parser.parse(texto)
+
+    assert excinfo.value.send_to_llm
+    assert excinfo.value.llm_output == texto
+    assert excinfo.value.observation.startswith("Invalid format: ")
+    assert erro in excinfo.value.observation
+    assert ACTION_FORMAT in excinfo.value.observation
+
+
+@pytest.mark.parametrize(
+    "conteudo, esperado",
+    [
+        ('{"a": "x"}', {"a": "x"}),
+        ("{'a': 'x'}", {"a": "x"}),
+        ("{'a': true}", {"a": True}),
+        ('```\n{"a": 1}\n```', {"a": 1}),
+        ('{"a": 1}\nObservação do modelo', {"a": 1}),
+    ],
+)
+def test_decode_action_input(conteudo, esperado):
+    assert decode_action_input(conteudo) == esperado
+
+
+def test_decode_action_input_invalido():
+    with pytest.raises(ValueError, match="invalid JSON"):
+        decode_action_input("{a: 1")